@@ -0,0 +1,4 @@
+"""
+Package: benchmarks
+In-process benchmarks of the supplier service routes
+"""
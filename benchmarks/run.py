@@ -0,0 +1,372 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Benchmarks of every supplier route
+
+Seeds a database with fake suppliers and drives each route through the Flask
+test client, then reports the throughput and the p50/p95/p99 latency of each
+route and saves them as JSON that can be compared between commits.
+
+Run the benchmarks against a throwaway SQLite file or PostgreSQL database:
+    python -m benchmarks.run run --size 100000 --output after.json
+    python -m benchmarks.run run --database postgresql://postgres@localhost/bench
+
+Compare two results and fail if a route got more than 20% slower:
+    python -m benchmarks.run compare before.json after.json --threshold 0.2
+
+WARNING: the tables of the benchmark database are dropped and recreated
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import subprocess
+
+DEFAULT_DATABASE = "sqlite:///{}".format(os.path.abspath("bench.db"))
+SEED_CHUNK_SIZE = 10000
+
+
+######################################################################
+#  S T A T I S T I C S
+######################################################################
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Returns a percentile of sorted values by the nearest-rank method"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: list, statuses: dict) -> dict:
+    """Returns the throughput and latency percentiles of a route"""
+    total = sum(latencies)
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "seconds": round(total, 6),
+        "throughput": round(len(latencies) / total, 2) if total else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "status": statuses,
+    }
+
+
+######################################################################
+#  R U N
+######################################################################
+def seed(size: int) -> list:
+    """Recreates the tables and adds size fake suppliers"""
+    # pylint: disable=import-outside-toplevel
+    from service.models import db, Supplier
+    from tests.factories import SupplierFactory
+
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    ids = []
+    for start in range(0, size, SEED_CHUNK_SIZE):
+        count = min(SEED_CHUNK_SIZE, size - start)
+        ids.extend(Supplier.create_many(SupplierFactory.build_batch(count)))
+        print("Seeded {}/{} suppliers".format(len(ids), size), file=sys.stderr)
+    return ids
+
+
+def scenarios(client, ids: list, rng: random.Random, list_requests: int) -> list:
+    """Returns the name, request count and request function of every route benchmark"""
+    # pylint: disable=import-outside-toplevel
+    from service.models import db, Supplier, SupplierChange
+    from tests.factories import SupplierFactory
+
+    created = []
+    bodies = {}
+    # names to search for, with prefixes of 2 to 8 characters
+    sample = rng.sample(ids, min(len(ids), 200))
+    names = [name for (name,) in db.session.query(Supplier.name).filter(Supplier.id.in_(sample))]
+    # a delta sync that picks up the last 100 changes of the seed
+    since = max((db.session.query(db.func.max(Supplier.revision)).scalar() or 0) - 100, 0)
+    # a change feed that catches up on the last 100 changes and ends
+    last_event_id = str(max(SupplierChange.last_id() - 100, 0))
+    db.session.remove()
+
+    def take(count):
+        # deletes use up the suppliers created by the benchmarks before the seeded ones
+        return [(created or ids).pop() for _ in range(min(count, len(created or ids)))]
+
+    def selected(count):
+        return {"id": rng.sample(ids, min(count, len(ids)))}
+
+    def supplier_body(supplier_id):
+        if supplier_id not in bodies:
+            bodies[supplier_id] = client.get("/suppliers/{}".format(supplier_id)).get_json()
+        return bodies[supplier_id]
+
+    def create():
+        resp = client.post("/suppliers", json=SupplierFactory().serialize())
+        created.append(resp.get_json()["id"])
+        return resp
+
+    def update():
+        supplier_id = rng.choice(ids)
+        body = dict(supplier_body(supplier_id), name="Updated {}".format(rng.random()))
+        return client.put("/suppliers/{}".format(supplier_id), json=body)
+
+    def patch():
+        body = {"name": "Patched {}".format(rng.random())}
+        return client.patch("/suppliers/{}".format(rng.choice(ids)), json=body)
+
+    def disable():
+        return client.put("/suppliers/{}/disable".format(rng.choice(ids)))
+
+    def enable():
+        return client.put("/suppliers/{}/enable".format(rng.choice(ids)))
+
+    def bulk_update():
+        body = {"category": "Category {}".format(rng.randint(0, 9))}
+        return client.patch("/suppliers", query_string=selected(100), json=body)
+
+    def bulk_disable():
+        return client.put("/suppliers/disable", query_string=selected(100))
+
+    def bulk_enable():
+        return client.put("/suppliers/enable", query_string=selected(100))
+
+    def bulk_delete():
+        return client.delete("/suppliers", query_string={"id": take(100)})
+
+    def bulk_create():
+        items = [SupplierFactory().serialize() for _ in range(100)]
+        resp = client.post("/suppliers/bulk", json=items)
+        created.extend(resp.get_json()["ids"])
+        return resp
+
+    def search():
+        name = rng.choice(names)
+        return client.get("/suppliers", query_string={"q": name[: rng.randint(2, 8)]})
+
+    def ndjson():
+        return client.get("/suppliers", headers={"Accept": "application/x-ndjson"})
+
+    def changes():
+        return client.get("/suppliers/changes", headers={"Last-Event-ID": last_event_id})
+
+    return [
+        ("list_suppliers", list_requests, lambda: client.get("/suppliers")),
+        ("list_suppliers_ndjson", list_requests, ndjson),
+        ("list_suppliers_page", None, lambda: client.get("/suppliers?limit=100")),
+        (
+            "list_suppliers_filtered",
+            None,
+            lambda: client.get("/suppliers?category=foods&availability=true&limit=100"),
+        ),
+        ("supplier_stats", None, lambda: client.get("/suppliers/stats")),
+        ("get_suppliers", None, lambda: client.get("/suppliers/{}".format(rng.choice(ids)))),
+        ("search_suppliers", None, search),
+        ("sync_suppliers", None, lambda: client.get("/suppliers?since={}".format(since))),
+        ("supplier_changes", None, changes),
+        ("create_suppliers", None, create),
+        ("create_suppliers_bulk", max(list_requests, 1), bulk_create),
+        ("update_suppliers", None, update),
+        ("patch_suppliers", None, patch),
+        ("update_suppliers_bulk", None, bulk_update),
+        ("disable_suppliers", None, disable),
+        ("enable_suppliers", None, enable),
+        ("disable_suppliers_bulk", None, bulk_disable),
+        ("enable_suppliers_bulk", None, bulk_enable),
+        # as many bulk deletes as bulk creates, so only created suppliers are deleted
+        ("delete_suppliers_bulk", max(list_requests, 1), bulk_delete),
+        (
+            "delete_suppliers",
+            None,
+            lambda: client.delete("/suppliers/{}".format((created or ids).pop())),
+        ),
+        ("metrics", None, lambda: client.get("/metrics")),
+    ]
+
+
+def run(args) -> dict:
+    """Seeds the database and benchmarks every route"""
+    os.environ["DATABASE_URI"] = args.database
+    if args.log_file:
+        # the service logs through the handlers of gunicorn, like in production
+        gunicorn_logger = logging.getLogger("gunicorn.error")
+        gunicorn_logger.addHandler(logging.FileHandler(args.log_file))
+        gunicorn_logger.setLevel(logging.INFO)
+    # the service reads the database URI when it is imported
+    # pylint: disable=import-outside-toplevel
+    from service import app
+
+    if not args.log_file:
+        app.logger.setLevel(logging.CRITICAL)
+        logging.getLogger("flask.app").setLevel(logging.CRITICAL)
+    # the change feed answers with what it has at once instead of waiting for more
+    app.config.update(
+        CHANGE_FEED_ENABLED=True, CHANGE_FEED_TIMEOUT=0, CHANGE_FEED_SETTLE_SECONDS=0
+    )
+    app.app_context().push()
+    ids = seed(args.size)
+    client = app.test_client()
+    rng = random.Random(args.seed)
+    results = {}
+    for name, count, request in scenarios(client, ids, rng, args.list_requests):
+        if args.routes and name not in args.routes:
+            continue
+        count = count or args.requests
+        for _ in range(min(args.warmup, count)):
+            request().get_data()
+        latencies = []
+        statuses = {}
+        for _ in range(count):
+            start = time.perf_counter()
+            resp = request()
+            resp.get_data()
+            latencies.append(time.perf_counter() - start)
+            statuses[str(resp.status_code)] = statuses.get(str(resp.status_code), 0) + 1
+        results[name] = summarize(latencies, statuses)
+        print(format_result(name, results[name]), file=sys.stderr)
+    return {
+        "meta": {
+            "size": args.size,
+            "database": args.database.split(":", 1)[0],
+            "requests": args.requests,
+            "commit": git_commit(),
+            "logging": bool(args.log_file),
+            "python": platform.python_version(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+
+
+def git_commit() -> str:
+    """Returns the commit that is being benchmarked, if known"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_result(name: str, result: dict) -> str:
+    """Formats the result of one route as a line of a table"""
+    line = "{:<26} {:>6} req {:>10.1f} req/s  p50 {:>9.3f} ms  p95 {:>9.3f} ms  p99 {:>9.3f} ms"
+    return line.format(
+        name,
+        result["requests"],
+        result["throughput"],
+        result["p50_ms"],
+        result["p95_ms"],
+        result["p99_ms"],
+    )
+
+
+######################################################################
+#  C O M P A R E
+######################################################################
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Returns a description of every route that got slower than the threshold"""
+    regressions = []
+    if baseline["meta"].get("size") != current["meta"].get("size"):
+        print("WARNING: the results were measured with different numbers of suppliers")
+    for name, result in sorted(current["results"].items()):
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        changes = {
+            "p50": _change(before["p50_ms"], result["p50_ms"]),
+            "p95": _change(before["p95_ms"], result["p95_ms"]),
+            "throughput": -_change(before["throughput"], result["throughput"]),
+        }
+        print(
+            "{:<26} p50 {:>+7.1%}  p95 {:>+7.1%}  throughput {:>+7.1%}".format(
+                name, changes["p50"], changes["p95"], -changes["throughput"]
+            )
+        )
+        # p95 is reported but only p50 and throughput are stable enough to fail on
+        for measure in ("p50", "throughput"):
+            if changes[measure] > threshold:
+                regressions.append(
+                    "{} {} is {:.1%} worse".format(name, measure, changes[measure])
+                )
+    return regressions
+
+
+def _change(before: float, after: float) -> float:
+    """Returns how much larger after is than before, as a fraction of before"""
+    return (after - before) / before if before else 0.0
+
+
+######################################################################
+#  M A I N
+######################################################################
+def main(argv=None) -> int:
+    """Runs or compares the benchmarks from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="benchmark every route")
+    run_parser.add_argument("--size", type=int, default=1000, help="suppliers to seed")
+    run_parser.add_argument(
+        "--database",
+        default=os.getenv("BENCHMARK_DATABASE_URI", DEFAULT_DATABASE),
+        help="database URI, whose tables are recreated",
+    )
+    run_parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    run_parser.add_argument(
+        "--list-requests", type=int, default=5, help="requests of the unpaged list routes"
+    )
+    run_parser.add_argument("--warmup", type=int, default=5, help="untimed requests per route")
+    run_parser.add_argument("--seed", type=int, default=42, help="seed of the random ids")
+    run_parser.add_argument("--routes", nargs="*", help="only benchmark these routes")
+    run_parser.add_argument("--log-file", help="write the INFO logs of the service to a file")
+    run_parser.add_argument("--output", help="file to write the results to as JSON")
+    run_parser.add_argument("--compare", help="results to compare with after the run")
+    run_parser.add_argument("--threshold", type=float, default=0.2)
+
+    compare_parser = commands.add_parser("compare", help="compare two results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.2)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        current = run(args)
+        if args.output:
+            with open(args.output, "w") as output:
+                json.dump(current, output, indent=2, sort_keys=True)
+        baseline_path = args.compare
+    else:
+        with open(args.current) as current_file:
+            current = json.load(current_file)
+        baseline_path = args.baseline
+    if not baseline_path:
+        return 0
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare(baseline, current, args.threshold)
+    for regression in regressions:
+        print("REGRESSION: {}".format(regression))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,11 +16,117 @@ if 'VCAP_SERVICES' in os.environ:
     vcap = json.loads(os.environ['VCAP_SERVICES'])
     DATABASE_URI = vcap['user-provided'][0]['credentials']['url']
 
+# Read replicas of the database, separated by commas, that the GET requests
+# take turns reading from. A client that wrote reads from the primary until
+# REPLICA_READ_YOUR_WRITES_SECONDS after its last write
+DATABASE_REPLICA_URIS = [
+    uri.strip() for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",") if uri.strip()
+]
+REPLICA_READ_YOUR_WRITES_SECONDS = float(os.getenv("REPLICA_READ_YOUR_WRITES_SECONDS", "5"))
+
 # Configure SQLAlchemy for suppliers
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
-SQLALCHEMY_POOL_SIZE = 2
+
+# Database connection pool of each worker process
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "4")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "false").lower() in ("true", "1", "yes"),
+}
+
+# Number of threads in each gunicorn worker, which share one connection pool
+WORKER_THREADS = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Keyset pagination of the supplier list
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# Number of rows fetched at a time when streaming the supplier list
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+
+# Maximum number of suppliers in one bulk request
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+
+# Per-worker read-through cache of suppliers looked up by id
+SUPPLIER_CACHE_SIZE = int(os.getenv("SUPPLIER_CACHE_SIZE", "1024"))
+SUPPLIER_CACHE_TTL = float(os.getenv("SUPPLIER_CACHE_TTL", "30"))
+
+# Seconds the counts of /suppliers/stats are cached by a worker, which only
+# sees the writes of other workers once they expire
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "5"))
+
+# Seconds the Idempotency-Key of a create is remembered, and how often each
+# worker removes the expired keys
+IDEMPOTENCY_KEY_TTL = float(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+IDEMPOTENCY_SWEEP_INTERVAL = float(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL", "300"))
+
+# Commit the creates and updates of concurrent requests of a worker together,
+# at most WRITE_BATCH_SIZE at a time and WRITE_BATCH_DELAY seconds after the
+# first, while up to WRITE_BATCH_QUEUE_SIZE writes wait (503 beyond that). A
+# write that is not committed WRITE_BATCH_TIMEOUT seconds after its batch is
+# due, which bounds the statements of a batch, is committed by its request
+WRITE_BATCHING = os.getenv("WRITE_BATCHING", "false").lower() in ("true", "1", "yes")
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+WRITE_BATCH_DELAY = float(os.getenv("WRITE_BATCH_DELAY", "0.005"))
+WRITE_BATCH_QUEUE_SIZE = int(os.getenv("WRITE_BATCH_QUEUE_SIZE", "1000"))
+WRITE_BATCH_TIMEOUT = float(os.getenv("WRITE_BATCH_TIMEOUT", "5"))
+
+# Number of changes kept in the change log for clients of the change feed to
+# catch up with, how often each stream polls the log, how many changes it
+# reads at a time, and how many seconds a stream stays open. A stream holds
+# a thread of its worker, so the feed is only served by threaded workers and
+# a stream ends before the 30 second timeout of a sync gunicorn worker
+CHANGE_FEED_ENABLED = os.getenv(
+    "CHANGE_FEED_ENABLED", "true" if WORKER_THREADS > 1 else "false"
+).lower() in ("true", "1", "yes")
+# Streams a worker holds open at once, leaving the rest of its threads to the API
+CHANGE_FEED_MAX_STREAMS = int(
+    os.getenv("CHANGE_FEED_MAX_STREAMS", str(max(1, WORKER_THREADS // 4)))
+)
+CHANGE_LOG_SIZE = int(os.getenv("CHANGE_LOG_SIZE", "10000"))
+CHANGE_LOG_TRIM_INTERVAL = float(os.getenv("CHANGE_LOG_TRIM_INTERVAL", "60"))
+CHANGE_FEED_POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "1"))
+CHANGE_FEED_BATCH_SIZE = int(os.getenv("CHANGE_FEED_BATCH_SIZE", "100"))
+CHANGE_FEED_TIMEOUT = float(os.getenv("CHANGE_FEED_TIMEOUT", "25"))
+
+# Changes younger than this are left for the next poll of the change feed, as
+# a transaction with an earlier change id may still be committing
+CHANGE_FEED_SETTLE_SECONDS = float(os.getenv("CHANGE_FEED_SETTLE_SECONDS", "1"))
+
+# Changes younger than this are left for the next GET /suppliers?since=, as
+# a transaction with an earlier revision may still be committing
+SYNC_SETTLE_SECONDS = float(os.getenv("SYNC_SETTLE_SECONDS", "1"))
+
+# Encode supplier lists straight from rows of columns, skipping the ORM
+FAST_LIST_SERIALIZATION = os.getenv("FAST_LIST_SERIALIZATION", "false").lower() in (
+    "true",
+    "1",
+    "yes",
+)
+
+# Directory shared by the gunicorn workers for their metrics, when there are
+# several worker processes, and how often each worker writes its metrics there
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+# SQL statements slower than this are logged with their parameters
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.5"))
+
+# Add the X-DB-Queries and X-DB-Time headers to every response
+DB_DEBUG_HEADERS = os.getenv("DB_DEBUG_HEADERS", "false").lower() in ("true", "1", "yes")
 
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "sup3r-s3cr3t")
 LOGGING_LEVEL = logging.INFO
+
+# Write the logs from a background thread, as text or as one JSON object per line
+LOG_QUEUE = os.getenv("LOG_QUEUE", "true").lower() in ("true", "1", "yes")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+
+# Only one in N of the high-volume log messages starting with each prefix is kept
+LOG_SAMPLE_RATES = {
+    "Processing lookup for id": int(os.getenv("LOG_LOOKUP_SAMPLE_RATE", "100")),
+}
@@ -33,25 +33,24 @@ from compare import expect
 def step_impl(context):
     """ Delete all Suppliers and load new ones """
     headers = {'Content-Type': 'application/json'}
-    # list all of the suppliers and delete them one by one
+    # list all of the suppliers and delete them in a single request
     context.resp = requests.get(context.base_url + '/suppliers', headers=headers)
     expect(context.resp.status_code).to_equal(200)
-    for supplier in context.resp.json():
-
-        context.resp = requests.delete(context.base_url + '/suppliers/' + str(supplier["id"]), headers=headers)
-        expect(context.resp.status_code).to_equal(204)
-    
-    # load the database with new suppliers
-    create_url = context.base_url + '/suppliers'
+    ids = [supplier["id"] for supplier in context.resp.json()]
+    if ids:
+        context.resp = requests.delete(context.base_url + '/suppliers', params={"id": ids})
+        expect(context.resp.status_code).to_equal(200)
+
+    # load the database with new suppliers in a single request
+    create_url = context.base_url + '/suppliers/bulk'
+    data = []
     for row in context.table:
-        data = {
+        data.append({
             "name": row['name'],
             "category": row['category'],
             "available": row['available'] in ['True', 'true', '1'],
             "status": row['status']
-
-        }
-        payload = json.dumps(data)
-        context.resp = requests.post(create_url, data=payload, headers=headers)
-        expect(context.resp.status_code).to_equal(201)
-
+        })
+    payload = json.dumps(data)
+    context.resp = requests.post(create_url, data=payload, headers=headers)
+    expect(context.resp.status_code).to_equal(201)
@@ -19,30 +19,58 @@ This module creates and configures the Flask app and sets up the logging
 and SQL database
 """
 import sys
+import time
 import logging
+
+# Seconds spent in each phase of the startup of this worker
+startup_times = {}
+
+
+def startup_phase(name: str, started: float) -> float:
+    """Adds the seconds since started to a startup phase and returns the time now"""
+    now = time.perf_counter()
+    startup_times[name] = startup_times.get(name, 0.0) + now - started
+    return now
+
+
+started = time.perf_counter()
+# pylint: disable=wrong-import-position
 from flask import Flask
 
+started = startup_phase("import", started)
+
 # Create Flask application
 app = Flask(__name__)
 app.config.from_object("config")
+started = startup_phase("config", started)
 
 # Import the routes After the Flask app is created
-# pylint: disable=wrong-import-position, cyclic-import
-from service import routes, models, error_handlers
+# pylint: disable=cyclic-import
+from service import routes, models, error_handlers, metrics, commands, log_handlers, replicas
+
+started = startup_phase("import", started)
 
 # Set up logging for production
 print("Setting up logging for {}...".format(__name__))
 app.logger.propagate = False
 if __name__ != "__main__":
     gunicorn_logger = logging.getLogger("gunicorn.error")
-    app.logger.handlers = gunicorn_logger.handlers
-    app.logger.setLevel(gunicorn_logger.level)
+    # the models log to flask.app, which is not the app.logger of Flask 2
+    loggers = [app.logger, models.logger]
+    for logger in loggers:
+        logger.propagate = False
+        logger.setLevel(gunicorn_logger.level)
     # Make all log formats consistent
-    formatter = logging.Formatter(
-        "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z"
-    )
-    for handler in app.logger.handlers:
+    formatter = log_handlers.make_formatter(app.config["LOG_FORMAT"])
+    for handler in gunicorn_logger.handlers:
         handler.setFormatter(formatter)
+    if app.config["LOG_QUEUE"]:
+        log_handlers.install_queue_logging(
+            loggers, gunicorn_logger.handlers, app.config["LOG_SAMPLE_RATES"]
+        )
+    else:
+        for logger in loggers:
+            logger.handlers = gunicorn_logger.handlers
     app.logger.info("Logging handler established")
 
 app.logger.info(70 * "*")
@@ -50,10 +78,17 @@ app.logger.info("  S U P P L I E R   S E R V I C E  ".center(70, "*"))
 app.logger.info(70 * "*")
 
 try:
-    models.init_db(app)  # make our sqlalchemy tables
+    replicas.init_replicas(app)
+    models.init_db(app)  # connects lazily, the tables are made by flask db-init
+    metrics.init_metrics(app)
 except Exception as error:  # pylint: disable=broad-except
     app.logger.critical("%s: Cannot continue", error)
     # gunicorn requires exit code 4 to stop spawning workers when they die
     sys.exit(4)
+startup_phase("init", started)
 
+app.logger.info(
+    "Startup timing: %s (the database connects on the first request)",
+    ", ".join("{} {:.3f}s".format(name, seconds) for name, seconds in startup_times.items()),
+)
 app.logger.info("Service initialized!")
@@ -0,0 +1,238 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: batching
+
+Group commit of the writes of a worker
+
+The writes of concurrent requests are put on a bounded queue, and a
+background thread runs them together in one transaction, each in its own
+SAVEPOINT, so a burst of writes costs one commit instead of one commit per
+request. Every caller waits for its own result or error, for at most the
+delay of a batch plus its timeout, and then commits its write itself.
+"""
+import time
+import queue
+import atexit
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+logger = logging.getLogger("flask.app")
+
+
+class WriteQueueFull(Exception):
+    """Used when there are too many writes waiting to be committed"""
+
+
+class WriteBatcher:
+    """Runs the writes of many callers in one transaction
+
+    A write is a function that takes the session of the batch. The batch is
+    committed when it has max_items writes, or max_delay seconds after its
+    first write was taken from the queue. A caller whose write is not
+    committed within max_delay plus timeout seconds commits it directly
+    """
+
+    def __init__(
+        self,
+        max_items: int = 100,
+        max_delay: float = 0.005,
+        max_queue: int = 1000,
+        timeout: float = 5.0,
+    ):
+        self.enabled = False
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue = queue.Queue(max_queue)
+        self._app = None
+        self._session_factory = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+
+    def configure(self, app, session_factory, enabled: bool = True, **options):
+        """Sets the app and session of the batches and the limits from the config
+
+        :param app: the Flask app whose context the batches run in
+        :type app: Flask
+        :param session_factory: returns a new session for each batch
+        :type session_factory: callable
+        :param enabled: whether the writes are batched at all
+        :type enabled: bool
+
+        """
+        self.stop()
+        self._app = app
+        self._session_factory = session_factory
+        self.enabled = enabled
+        self.max_items = options.get("max_items", self.max_items)
+        self.max_delay = options.get("max_delay", self.max_delay)
+        self.timeout = options.get("timeout", self.timeout)
+        if "max_queue" in options:
+            self._queue = queue.Queue(options["max_queue"])
+
+    def submit(self, write) -> Future:
+        """Queues a write and returns the Future of its result
+
+        :param write: a function that takes a session and makes the changes
+        :type write: callable
+
+        :return: the result of the write once its batch is committed
+        :rtype: Future
+
+        """
+        future = Future()
+        self._start()
+        try:
+            self._queue.put_nowait((write, future))
+        except queue.Full as error:
+            raise WriteQueueFull(
+                "Too many writes are waiting to be committed, try again later"
+            ) from error
+        return future
+
+    def run(self, write):
+        """Runs a write in the next batch and returns its result or raises its error
+
+        A write that is still queued when its batch should have been committed
+        is taken back and committed directly, so a stuck or dead background
+        thread never holds up the request
+        """
+        future = self.submit(write)
+        try:
+            return future.result(timeout=self.max_delay + self.timeout)
+        except FutureTimeout:
+            if not future.cancel():
+                # the batch has already started the write, which must not run twice
+                return future.result(timeout=self.timeout)
+        logger.warning(
+            "Write was not committed within %.3fs, committing it directly",
+            self.max_delay + self.timeout,
+        )
+        return self._commit_directly(write)
+
+    def stop(self):
+        """Commits the queued writes and stops the background thread"""
+        thread = self._thread
+        if thread is not None:
+            if thread.is_alive():
+                self._queue.put(None)
+                thread.join()
+            self._thread = None
+
+    def _start(self):
+        """Starts the background thread in the process that uses it, or again if it died"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._thread is None:
+                atexit.register(self.stop)
+            else:
+                logger.error("The write batcher thread has stopped, starting it again")
+            self._thread = threading.Thread(
+                target=self._worker, name="write-batcher", daemon=True
+            )
+            self._thread.start()
+
+    def _worker(self):
+        """Takes the writes from the queue in batches until stopped"""
+        with self._app.app_context():
+            while True:
+                batch, stopping = self._take_batch()
+                if batch:
+                    self._commit(batch)
+                if stopping:
+                    return
+
+    def _take_batch(self) -> tuple:
+        """Waits for a write and takes the writes that follow it within the delay"""
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_items:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=max(timeout, 0.0))
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _commit(self, batch: list):
+        """Runs each write of a batch in a SAVEPOINT and commits them all at once"""
+        try:
+            session = self._session_factory()
+        except Exception as error:  # pylint: disable=broad-except
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        results = []
+        errors = []
+        try:
+            self._run_writes(session, batch, results, errors)
+            session.commit()
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error("Batch of %d writes failed: %s", len(batch), error)
+            session.rollback()
+            errors.extend((future, error) for future, _ in results)
+            results = []
+        finally:
+            # the objects of the writes go back to their callers with their values
+            session.expunge_all()
+            session.close()
+        self.batches += 1
+        self.writes += len(results)
+        # the callers only hear back once the batch is committed or rolled back
+        for future, result in results:
+            future.set_result(result)
+        for future, error in errors:
+            future.set_exception(error)
+
+    def _commit_directly(self, write):
+        """Runs a write in a session of its own and commits it"""
+        session = self._session_factory()
+        try:
+            result = write(session)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.expunge_all()
+            session.close()
+
+    @staticmethod
+    def _run_writes(session, batch: list, results: list, errors: list):
+        """Runs each write of a batch in its own SAVEPOINT and keeps its result or error"""
+        for write, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with session.begin_nested():
+                    result = write(session)
+            except Exception as error:  # pylint: disable=broad-except
+                # only the SAVEPOINT of the write is rolled back
+                errors.append((future, error))
+            else:
+                results.append((future, result))
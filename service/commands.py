@@ -0,0 +1,71 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: commands
+
+Flask CLI commands for the supplier service
+
+flask db-init - creates the database tables once, before the workers start
+flask idempotency-sweep - removes the expired Idempotency-Keys
+flask change-log-trim - removes all but the latest changes from the change log
+"""
+import os
+import click
+from service.models import Supplier, IdempotencyKey, SupplierChange
+from . import app
+
+
+######################################################################
+# CREATE THE DATABASE TABLES
+######################################################################
+@app.cli.command("db-init")
+@click.option(
+    "--leader-only",
+    is_flag=True,
+    help="Only create the tables on the first instance of the application",
+)
+def db_init(leader_only):
+    """Creates the database tables that do not exist yet"""
+    instance = os.getenv("CF_INSTANCE_INDEX", "0")
+    if leader_only and instance != "0":
+        click.echo("Skipping db-init on instance {}".format(instance))
+        return
+    Supplier.create_tables()
+    click.echo("Database tables created")
+
+
+######################################################################
+# REMOVE THE EXPIRED IDEMPOTENCY KEYS
+######################################################################
+@app.cli.command("idempotency-sweep")
+@click.option("--ttl", type=float, help="Seconds a key is kept, IDEMPOTENCY_KEY_TTL by default")
+def idempotency_sweep(ttl):
+    """Removes the Idempotency-Keys that have expired"""
+    if ttl is None:
+        ttl = app.config["IDEMPOTENCY_KEY_TTL"]
+    count = IdempotencyKey.sweep(ttl)
+    click.echo("Removed {} expired idempotency keys".format(count))
+
+
+######################################################################
+# TRIM THE CHANGE LOG
+######################################################################
+@app.cli.command("change-log-trim")
+@click.option("--size", type=int, help="Changes to keep, CHANGE_LOG_SIZE by default")
+def change_log_trim(size):
+    """Removes all but the latest changes from the change log"""
+    if size is None:
+        size = app.config["CHANGE_LOG_SIZE"]
+    count = SupplierChange.trim(size)
+    click.echo("Removed {} changes from the change log".format(count))
@@ -15,7 +15,9 @@
 Module: error_handlers
 """
 from flask import jsonify
+from sqlalchemy.orm.exc import StaleDataError
 from service.models import DataValidationError
+from service.batching import WriteQueueFull
 from . import app, status
 
 ######################################################################
@@ -27,6 +29,45 @@ def request_validation_error(error):
     return bad_request(error)
 
 
+@app.errorhandler(StaleDataError)
+def stale_data_error(error):
+    """Handles concurrent changes to the same row"""
+    app.logger.info("Stale data: %s", error)
+    return conflict("The Supplier was changed by another request, try again.")
+
+
+@app.errorhandler(WriteQueueFull)
+def write_queue_full(error):
+    """Handles writes that cannot be queued with 503_SERVICE_UNAVAILABLE"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            error="Service Unavailable",
+            message=message,
+        ),
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+        {"Retry-After": "1"},
+    )
+
+
+@app.errorhandler(status.HTTP_503_SERVICE_UNAVAILABLE)
+def service_unavailable(error):
+    """Handles requests the service is too busy for with 503_SERVICE_UNAVAILABLE"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            error="Service Unavailable",
+            message=message,
+        ),
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+        {"Retry-After": "1"},
+    )
+
+
 @app.errorhandler(status.HTTP_400_BAD_REQUEST)
 def bad_request(error):
     """Handles bad reuests with 400_BAD_REQUEST"""
@@ -66,6 +107,32 @@ def method_not_supported(error):
     )
 
 
+@app.errorhandler(status.HTTP_409_CONFLICT)
+def conflict(error):
+    """Handles conflicting changes with 409_CONFLICT"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(status=status.HTTP_409_CONFLICT, error="Conflict", message=message),
+        status.HTTP_409_CONFLICT,
+    )
+
+
+@app.errorhandler(status.HTTP_412_PRECONDITION_FAILED)
+def precondition_failed(error):
+    """Handles failed conditional requests with 412_PRECONDITION_FAILED"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_412_PRECONDITION_FAILED,
+            error="Precondition Failed",
+            message=message,
+        ),
+        status.HTTP_412_PRECONDITION_FAILED,
+    )
+
+
 @app.errorhandler(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
 def mediatype_not_supported(error):
     """Handles unsuppoted media requests with 415_UNSUPPORTED_MEDIA_TYPE"""
@@ -81,6 +148,21 @@ def mediatype_not_supported(error):
     )
 
 
+@app.errorhandler(status.HTTP_422_UNPROCESSABLE_ENTITY)
+def unprocessable_entity(error):
+    """Handles requests that cannot be processed with 422_UNPROCESSABLE_ENTITY"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            error="Unprocessable Entity",
+            message=message,
+        ),
+        status.HTTP_422_UNPROCESSABLE_ENTITY,
+    )
+
+
 @app.errorhandler(status.HTTP_500_INTERNAL_SERVER_ERROR)
 def internal_server_error(error):
     """Handles unexpected server error with 500_SERVER_ERROR"""
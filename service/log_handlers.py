@@ -0,0 +1,133 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: log_handlers
+
+Non-blocking logging for the request path
+
+The loggers of the service only put their records on a queue, and a
+QueueListener thread formats them and writes them to the real handlers.
+High-volume messages can be sampled before they are queued, and records
+can be written as one JSON object per line.
+"""
+import copy
+import json
+import queue
+import atexit
+import logging
+import itertools
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S %z"
+
+
+class PreparedQueueHandler(QueueHandler):
+    """A QueueHandler that leaves all of the formatting to the listener thread"""
+
+    def prepare(self, record):
+        """Merges the arguments into the message, which is all the queue needs"""
+        # the arguments may change after the call, so they are merged now, but
+        # the timestamp and exception are formatted by the listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class BackgroundListener(QueueListener):
+    """A QueueListener that can be stopped more than once"""
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+class SamplingFilter(logging.Filter):
+    """Passes only one in every N records of each logger that start with a prefix"""
+
+    def __init__(self, rates: dict):
+        """
+        :param rates: the sample rate N of the message templates by prefix
+        :type rates: dict
+        """
+        super().__init__()
+        self.rates = dict(rates)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not isinstance(record.msg, str):
+            return True
+        for prefix, rate in self.rates.items():
+            if rate > 1 and record.msg.startswith(prefix):
+                counter = self._counters.get((record.name, prefix))
+                if counter is None:
+                    with self._lock:
+                        counter = self._counters.setdefault(
+                            (record.name, prefix), itertools.count()
+                        )
+                return next(counter) % rate == 0
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one line of JSON"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def make_formatter(log_format: str = "text") -> logging.Formatter:
+    """Returns the formatter for the text or json log format"""
+    if log_format == "json":
+        return JsonFormatter(datefmt=DATE_FORMAT)
+    return logging.Formatter(TEXT_FORMAT, DATE_FORMAT)
+
+
+def install_queue_logging(loggers: list, handlers: list, sample_rates: dict = None):
+    """Sends the records of the loggers to the handlers through a background thread
+
+    :param loggers: the loggers that should not block on their handlers
+    :type loggers: list
+    :param handlers: the handlers that write the records
+    :type handlers: list
+    :param sample_rates: the sample rate of high-volume messages by prefix
+    :type sample_rates: dict
+
+    :return: the started listener
+    :rtype: BackgroundListener
+
+    """
+    log_queue = queue.SimpleQueue()
+    queue_handler = PreparedQueueHandler(log_queue)
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+    listener = BackgroundListener(log_queue, *handlers, respect_handler_level=True)
+    for logger in loggers:
+        logger.handlers = [queue_handler]
+    listener.start()
+    # write the records that are still queued when the worker exits
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,474 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: metrics
+
+A small metrics registry that is rendered in the Prometheus text format
+
+Every route handler is timed by request hooks that count the requests by
+status code and observe the request latency and the time spent in the
+database. With DB_DEBUG_HEADERS set, the number of queries and the database
+time of each request are also sent in the X-DB-Queries and X-DB-Time headers.
+
+When METRICS_MULTIPROC_DIR is set, each gunicorn worker writes a snapshot of
+its metrics to its own file in that directory and /metrics adds up the
+snapshots of all of the workers. The counters of the workers that have
+exited are added to one file of retired metrics and their files are removed.
+"""
+import os
+import json
+import time
+import fcntl
+import atexit
+import threading
+from bisect import bisect_left
+from flask import g, request
+from service.models import pool_status, pool_stats, supplier_cache
+from . import app, startup_times
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    """A named family of samples that share the same label names"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), merge: str = "sum"):
+        """
+        :param name: the name of the metric
+        :type name: str
+        :param help_text: the description of the metric
+        :type help_text: str
+        :param labels: the names of the labels of each sample
+        :type labels: tuple
+        :param merge: how the samples of workers are combined, sum or max
+        :type merge: str
+        """
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.merge = merge
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def snapshot(self) -> dict:
+        """Returns the samples of the metric in a form that can be saved as JSON"""
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "help": self.help_text,
+                "labels": list(self.labels),
+                "merge": self.merge,
+                "samples": [[list(key), value] for key, value in self.samples.items()],
+            }
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Adds an amount to the sample with the given labels"""
+        key = self._key(labels)
+        with self._lock:
+            self.samples[key] = self.samples.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels):
+        """Sets the total of a counter that is kept somewhere else"""
+        with self._lock:
+            self.samples[self._key(labels)] = float(value)
+
+
+class Gauge(Metric):
+    """A value that can go up and down"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        """Sets the sample with the given labels"""
+        with self._lock:
+            self.samples[self._key(labels)] = float(value)
+
+
+class Histogram(Metric):
+    """Observations counted in buckets, with their count and sum"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        """Counts an observation in its bucket"""
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                # one count per bucket plus +Inf, then the sum of the observations
+                sample = self.samples[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            sample[index] += 1
+            sample[-1] += value
+
+    def snapshot(self) -> dict:
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+
+class MetricsRegistry:
+    """The metrics of a worker, optionally shared with other workers through files"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.directory = None
+        self.flush_interval = 5.0
+        self._flushed = 0.0
+        self._pid = None
+
+    def register(self, metric: Metric) -> Metric:
+        """Adds a metric to the registry"""
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector):
+        """Adds a function that updates metrics just before they are read"""
+        self.collectors.append(collector)
+
+    def configure(self, directory: str = None, flush_interval: float = 5.0):
+        """Shares the metrics with other worker processes through a directory"""
+        self.directory = directory
+        self.flush_interval = flush_interval
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def collect(self) -> dict:
+        """Returns the snapshots of all of the metrics of this worker"""
+        for collector in self.collectors:
+            collector()
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def flush(self, force: bool = False):
+        """Writes the metrics of this worker to its file in the shared directory"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed < self.flush_interval:
+            return
+        self._flushed = now
+        path = os.path.join(self.directory, "metrics_{}.json".format(os.getpid()))
+        if self._pid != os.getpid():
+            # a file with the pid of this new process was left by a worker that exited
+            self._pid = os.getpid()
+            if os.path.exists(path):
+                self._retire([path])
+        _write_json(path, {"pid": os.getpid(), "metrics": self.collect()})
+
+    def _snapshots(self) -> list:
+        """Returns the snapshots of every worker that shares the directory"""
+        if not self.directory:
+            return [(os.getpid(), self.collect())]
+        self.flush(force=True)
+        snapshots = self._read_snapshots()
+        dead = [path for path, pid, _ in snapshots if pid is not None and not _pid_alive(pid)]
+        if dead:
+            self._retire(dead)
+            snapshots = self._read_snapshots()
+        return [(pid, metrics) for _, pid, metrics in snapshots]
+
+    def _read_snapshots(self) -> list:
+        """Returns the path, pid and metrics of every file in the directory"""
+        snapshots = []
+        for file_name in sorted(os.listdir(self.directory)):
+            if not (file_name.startswith("metrics_") and file_name.endswith(".json")):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                with open(path) as snapshot_file:
+                    data = json.load(snapshot_file)
+            except (OSError, ValueError):
+                continue
+            snapshots.append((path, data["pid"], data["metrics"]))
+        return snapshots
+
+    def _retire(self, paths: list):
+        """Adds the counters in the files of workers that exited to the retired metrics
+
+        The files are removed, so a restarted worker does not reset the
+        counters and the directory does not grow with every worker. The
+        workers take turns with a lock on the directory, so the metrics of
+        a file are only added once
+        """
+        retired_path = os.path.join(self.directory, "metrics_retired.json")
+        with open(os.path.join(self.directory, "metrics.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            retired = _read_metrics(retired_path)
+            merged = {name: _merge_samples({}, snapshot) for name, snapshot in retired.items()}
+            for path in paths:
+                # a file that is gone was retired by another worker already
+                for name, snapshot in _read_metrics(path).items():
+                    # gauges describe live processes, counters outlive their worker
+                    if snapshot["kind"] == "gauge":
+                        continue
+                    retired.setdefault(name, snapshot)
+                    _merge_samples(merged.setdefault(name, {}), snapshot)
+            for name, samples in merged.items():
+                retired[name] = dict(
+                    retired[name], samples=[[list(key), value] for key, value in samples.items()]
+                )
+            _write_json(retired_path, {"pid": None, "metrics": retired})
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def merge(self) -> dict:
+        """Combines the snapshots of all of the workers into one"""
+        merged = {}
+        for pid, metrics in self._snapshots():
+            alive = pid is None or _pid_alive(pid)
+            for name, snapshot in metrics.items():
+                # gauges describe live processes, counters outlive their worker
+                if snapshot["kind"] == "gauge" and not alive:
+                    continue
+                target = merged.setdefault(name, dict(snapshot, samples={}))
+                _merge_samples(target["samples"], snapshot)
+        return merged
+
+    def render(self) -> str:
+        """Returns the metrics of all of the workers in the Prometheus text format"""
+        lines = []
+        for name, snapshot in sorted(self.merge().items()):
+            lines.append("# HELP {} {}".format(name, snapshot["help"]))
+            lines.append("# TYPE {} {}".format(name, snapshot["kind"]))
+            label_names = snapshot["labels"]
+            for key, value in sorted(snapshot["samples"].items()):
+                labels = list(zip(label_names, key))
+                if snapshot["kind"] != "histogram":
+                    lines.append("{}{} {}".format(name, _labels(labels), _number(value)))
+                    continue
+                cumulative = 0
+                bounds = [_number(bound) for bound in snapshot["buckets"]] + ["+Inf"]
+                for bound, count in zip(bounds, value[:-1]):
+                    cumulative += count
+                    lines.append(
+                        "{}_bucket{} {}".format(name, _labels(labels + [("le", bound)]), cumulative)
+                    )
+                lines.append("{}_sum{} {}".format(name, _labels(labels), _number(value[-1])))
+                lines.append("{}_count{} {}".format(name, _labels(labels), cumulative))
+        return "\n".join(lines) + "\n"
+
+
+def _merge_samples(samples: dict, snapshot: dict) -> dict:
+    """Adds the samples of a snapshot to samples by their label values"""
+    for key, value in snapshot["samples"]:
+        key = tuple(key)
+        if key not in samples:
+            samples[key] = value
+        elif snapshot["kind"] == "histogram":
+            samples[key] = [a + b for a, b in zip(samples[key], value)]
+        elif snapshot["merge"] == "max":
+            samples[key] = max(samples[key], value)
+        else:
+            samples[key] += value
+    return samples
+
+
+def _read_metrics(path: str) -> dict:
+    """Returns the metrics in a file, or none if it cannot be read"""
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)["metrics"]
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path: str, data: dict):
+    """Writes a file that readers never see half written"""
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "w") as json_file:
+        json.dump(data, json_file)
+    os.replace(temp_path, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    """Returns True if a process with the pid is still running"""
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _labels(labels: list) -> str:
+    """Formats the labels of a sample"""
+    if not labels:
+        return ""
+    escaped = (
+        '{}="{}"'.format(
+            name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        )
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value: float) -> str:
+    """Formats a sample value"""
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+######################################################################
+#  M E T R I C S
+######################################################################
+registry = MetricsRegistry()
+
+REQUESTS = registry.register(
+    Counter(
+        "http_requests_total",
+        "Requests handled by route, method and status code",
+        ("endpoint", "method", "status"),
+    )
+)
+REQUEST_LATENCY = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Time to handle a request by route and method",
+        ("endpoint", "method"),
+    )
+)
+REQUEST_DB_TIME = registry.register(
+    Histogram(
+        "http_request_db_seconds",
+        "Time spent in the database per request by route and method",
+        ("endpoint", "method"),
+    )
+)
+POOL_SIZE = registry.register(Gauge("db_pool_size", "Connections kept in the pool"))
+POOL_CHECKED_OUT = registry.register(Gauge("db_pool_checked_out", "Connections in use"))
+POOL_OVERFLOW = registry.register(Gauge("db_pool_overflow", "Overflow connections open"))
+POOL_CHECKOUTS = registry.register(Counter("db_pool_checkouts_total", "Connection checkouts"))
+POOL_TIMEOUTS = registry.register(
+    Counter("db_pool_timeouts_total", "Connection checkouts that timed out")
+)
+POOL_WAIT = registry.register(
+    Counter("db_pool_checkout_wait_seconds_total", "Time spent waiting for connections")
+)
+POOL_MAX_WAIT = registry.register(
+    Gauge("db_pool_checkout_wait_seconds_max", "Longest wait for a connection", merge="max")
+)
+CACHE_SIZE = registry.register(Gauge("supplier_cache_size", "Suppliers in the cache"))
+CACHE_HITS = registry.register(Counter("supplier_cache_hits_total", "Supplier cache hits"))
+CACHE_MISSES = registry.register(Counter("supplier_cache_misses_total", "Supplier cache misses"))
+CACHE_EVICTIONS = registry.register(
+    Counter("supplier_cache_evictions_total", "Suppliers evicted from the cache")
+)
+
+STARTUP = registry.register(
+    Gauge("service_startup_seconds", "Time spent in each phase of the startup", ("phase",))
+)
+
+
+def collect_startup_metrics():
+    """Copies the startup timing of this worker into the registry"""
+    for phase, seconds in startup_times.items():
+        STARTUP.set(seconds, phase=phase)
+    if pool_stats.connect_seconds is not None:
+        STARTUP.set(pool_stats.connect_seconds, phase="db_connect")
+
+
+def collect_pool_metrics():
+    """Copies the state of the connection pool into the registry"""
+    pool = pool_status()
+    for gauge, key in (
+        (POOL_SIZE, "size"),
+        (POOL_CHECKED_OUT, "checked_out"),
+        (POOL_OVERFLOW, "overflow"),
+    ):
+        if key in pool:
+            gauge.set(pool[key])
+    POOL_CHECKOUTS.set(pool["checkouts"])
+    POOL_TIMEOUTS.set(pool["timeouts"])
+    POOL_WAIT.set(pool["wait_seconds"])
+    POOL_MAX_WAIT.set(pool["max_wait_seconds"])
+
+
+def collect_cache_metrics():
+    """Copies the counters of the supplier cache into the registry"""
+    stats = supplier_cache.stats()
+    CACHE_SIZE.set(stats["size"])
+    CACHE_HITS.set(stats["hits"])
+    CACHE_MISSES.set(stats["misses"])
+    CACHE_EVICTIONS.set(stats["evictions"])
+
+
+registry.add_collector(collect_startup_metrics)
+registry.add_collector(collect_pool_metrics)
+registry.add_collector(collect_cache_metrics)
+
+
+def init_metrics(flask_app):
+    """Configures the registry from the Flask app"""
+    registry.configure(
+        flask_app.config.get("METRICS_MULTIPROC_DIR"),
+        flask_app.config.get("METRICS_FLUSH_INTERVAL", 5.0),
+    )
+    if registry.directory:
+        atexit.register(registry.flush, force=True)
+
+
+######################################################################
+#  R E Q U E S T   H O O K S
+######################################################################
+@app.before_request
+def start_request_timer():
+    """Starts timing a request"""
+    g.request_start = time.perf_counter()
+    g.db_time = 0.0
+    g.db_queries = 0
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Records the count, latency and database time of a request"""
+    start = g.pop("request_start", None)
+    if start is None:
+        return response
+    endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    REQUEST_LATENCY.observe(
+        time.perf_counter() - start, endpoint=endpoint, method=request.method
+    )
+    REQUEST_DB_TIME.observe(g.get("db_time", 0.0), endpoint=endpoint, method=request.method)
+    registry.flush()
+    return response
+
+
+@app.after_request
+def add_db_headers(response):
+    """Adds the query count and database time of a request as debug headers"""
+    if app.config.get("DB_DEBUG_HEADERS"):
+        response.headers["X-DB-Queries"] = str(g.get("db_queries", 0))
+        response.headers["X-DB-Time"] = "{:.6f}".format(g.get("db_time", 0.0))
+    return response
@@ -20,34 +20,348 @@ All of the models are stored in this module
 Models
 ------
 Supplier - A supplier that we interact with in the marketplace
+IdempotencyKey - The Idempotency-Key and response of a request that created a Supplier
+SupplierChange - A change to a Supplier in the change log of the change feed
+SupplierTombstone - The revision at which a Supplier was deleted, for delta syncs
 
 Attributes:
 -----------
 name (string) - the name of the supplier
 category (string) - the category the supplier belongs to
 available (boolean) - whether or not the supplier is available
+status (string) - the status of the supplier, like enabled or disabled
+version (int) - the version of the row, incremented on every update
+revision (int) - the revision of the last change, which grows with every write
+updated_at (datetime) - when the Supplier was last changed, in UTC
 
 """
+import json
+import time
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from enum import Enum
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, current_app, g, has_app_context, has_request_context, jsonify
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import orm
+from sqlalchemy import inspect, exc, event, func, and_, or_, case, select, table, column
+from sqlalchemy import DDL, BigInteger, Sequence, cast, collate, union
+from sqlalchemy import text as text_clause
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.orm.util import identity_key
+from service.batching import WriteBatcher
 
 logger = logging.getLogger("flask.app")
 
+
+class PoolStats:
+    """Counters of the connection checkouts from the database pool"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.connect_seconds = None
+        self._lock = threading.Lock()
+
+    def record_checkout(self, wait_seconds: float, timed_out: bool = False):
+        """Records how long a checkout waited for a connection"""
+        with self._lock:
+            if self.connect_seconds is None and not timed_out:
+                # the first checkout of the worker opens its first connection
+                self.connect_seconds = wait_seconds
+                logger.info("Connected to the database in %.3fs", wait_seconds)
+            self.checkouts += 1
+            self.timeouts += int(timed_out)
+            self.wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+
+# Checkout counters of the connection pool of this worker
+pool_stats = PoolStats()
+
+
+class QueryTimer:
+    """Times the SQL statements of each request and logs the slow ones"""
+
+    def __init__(self, slow_seconds: float = 0.5):
+        """
+        :param slow_seconds: statements slower than this are logged
+        :type slow_seconds: float
+        """
+        self.slow_seconds = slow_seconds
+
+    def install(self, slow_seconds: float = None):
+        """Listens to the statements sent by every engine"""
+        if slow_seconds is not None:
+            self.slow_seconds = slow_seconds
+        if not event.contains(Engine, "before_cursor_execute", self.before_execute):
+            event.listen(Engine, "before_cursor_execute", self.before_execute)
+            event.listen(Engine, "after_cursor_execute", self.after_execute)
+
+    @staticmethod
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        """Notes when a statement is sent to the database
+
+        The time is kept on the execution context of the statement, which is
+        dropped with it, so a statement that fails leaves nothing behind
+        """
+        if context is not None:
+            context.query_start = time.perf_counter()
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        """Adds a statement to the query count and database time of the request"""
+        start = getattr(context, "query_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        if has_request_context():
+            g.db_time = g.get("db_time", 0.0) + elapsed
+            g.db_queries = g.get("db_queries", 0) + 1
+        if elapsed >= self.slow_seconds:
+            logger.warning(
+                "Slow query (%.3fs): %s %s", elapsed, statement, repr(parameters)[:1000]
+            )
+
+
+# Times the statements of every request of this worker
+query_timer = QueryTimer()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that measures how long each checkout waits for a connection"""
+
+    def connect(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            pool_stats.record_checkout(time.perf_counter() - start, timed_out)
+
+
+def replica_bind():
+    """Returns the bind key of the replica the current request reads from, or None"""
+    if not has_app_context():
+        return None
+    return g.get("db_replica")
+
+
+class RoutingSession(SignallingSession):
+    """A session that runs the queries of read-only requests on a replica"""
+
+    def get_bind(self, mapper=None, clause=None):
+        bind = replica_bind()
+        if bind is not None and not self._flushing:
+            return get_state(self.app).db.get_engine(self.app, bind=bind)
+        return super().get_bind(mapper, clause)
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy that creates its engines with an instrumented connection pool
+
+    The sessions send the queries of the requests that read from a replica
+    to the engine of that replica, see service.replicas
+    """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        if sa_url.get_backend_name() == "sqlite":
+            # SQLite uses a null or static pool that cannot be sized
+            for option in ("pool_size", "max_overflow", "pool_timeout"):
+                engine_opts.pop(option, None)
+        else:
+            engine_opts.setdefault("poolclass", InstrumentedQueuePool)
+        return super().create_engine(sa_url, engine_opts)
+
+
 # Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+db = PooledSQLAlchemy()
 
 
 def init_db(app):
     """Initialize the SQLAlchemy app"""
+    query_timer.install(app.config.get("SLOW_QUERY_SECONDS"))
     Supplier.init_db(app)
+    check_pool_size(app)
+
+
+def check_pool_size(app):
+    """Warns if the connection pool is smaller than the worker concurrency"""
+    options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    pool_size = options.get("pool_size", 5)
+    threads = app.config.get("WORKER_THREADS", 1)
+    if pool_size < threads:
+        logger.warning(
+            "Database pool size %d is smaller than the %d threads of this worker, "
+            "requests will wait for connections or use overflow connections",
+            pool_size,
+            threads,
+        )
+
+
+def pool_status() -> dict:
+    """Returns the state and checkout counters of the connection pool"""
+    pool = db.engine.pool
+    status = {
+        "checkouts": pool_stats.checkouts,
+        "timeouts": pool_stats.timeouts,
+        "wait_seconds": pool_stats.wait_seconds,
+        "max_wait_seconds": pool_stats.max_wait_seconds,
+    }
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+        )
+    return status
+
+
+def _supports_returning() -> bool:
+    """Returns True if the database can return rows from INSERT and UPDATE"""
+    dialect = db.engine.dialect
+    return bool(
+        getattr(dialect, "update_returning", getattr(dialect, "full_returning", False))
+    )
 
 
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
+class LRUCache:
+    """
+    A bounded, thread safe cache with LRU eviction and a time to live
+
+    Each worker process has its own cache, so entries may be stale for up to
+    the time to live when another worker changes the data
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def configure(self, maxsize: int, ttl: float):
+        """Changes the size and time to live of the cache and empties it"""
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, key):
+        """Returns the value cached for a key, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """Caches a value, evicting the least recently used entries when full"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Removes the value cached for a key"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Removes all of the cached values"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Returns the size and hit, miss and eviction counters of the cache"""
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# Read-through cache of Supplier rows used by Supplier.find()
+supplier_cache = LRUCache()
+
+# Cache of the grouped counts of Supplier.stats(), emptied by every write
+stats_cache = LRUCache(maxsize=64, ttl=5.0)
+
+# Commits the creates and updates of concurrent requests together, when the
+# WRITE_BATCHING option is on
+write_batcher = WriteBatcher()
+
+
+# The revisions of PostgreSQL come from a sequence, see next_revision
+revision_sequence = Sequence("supplier_revision_seq", metadata=db.Model.metadata)
+# The revisions of the other databases are one more than the latest one
+NEXT_REVISION_SQL = (
+    "(SELECT max(coalesce((SELECT max(revision) FROM supplier), 0), "
+    "coalesce((SELECT max(revision) FROM supplier_tombstone), 0)) + 1)"
+)
+
+
+class next_revision(FunctionElement):  # pylint: disable=invalid-name,too-many-ancestors
+    """The next revision of the Suppliers, for the inserts, updates and deletes"""
+
+    type = BigInteger()
+    name = "next_revision"
+    inherit_cache = True
+
+
+@compiles(next_revision)
+def compile_next_revision(element, compiler, **kw):
+    """Takes one more than the latest revision, where there are no sequences
+
+    The writes to SQLite are serialized, so the revisions still only go up,
+    but the subquery runs once per statement and every row of a set-based
+    UPDATE gets the same revision
+    """
+    return NEXT_REVISION_SQL
+
+
+@compiles(next_revision, "postgresql")
+def compile_next_revision_postgresql(element, compiler, **kw):
+    """Takes the next value of the revision sequence"""
+    return "nextval('{}')".format(revision_sequence.name)
+
+
 # class Gender(Enum):
 #     """Enumeration of valid Pet Genders"""
 
@@ -68,10 +382,40 @@ class Supplier(db.Model):
     # Table Schema
     ##################################################
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(63), nullable=False)
+    name = db.Column(db.String(63), nullable=False, index=True)
     category = db.Column(db.String(63), nullable=False)
     available = db.Column(db.Boolean(), nullable=False, default=False)
     status = db.Column(db.String(63), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # Every insert and update takes the next revision, so the rows changed
+    # after a revision can be found with the index, see changed_since()
+    revision = db.Column(
+        db.BigInteger,
+        nullable=False,
+        index=True,
+        default=next_revision(),
+        onupdate=next_revision(),
+    )
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    # The version is checked and incremented by every ORM update, so
+    # concurrent changes to a stale copy raise StaleDataError
+    __mapper_args__ = {"version_id_col": version}
+
+    # The attributes clients may write
+    FIELDS = ("name", "category", "available", "status")
+
+    # Composite indexes that back the filters of find_by_filters()
+    __table_args__ = (
+        db.Index(
+            "ix_supplier_category_available_status", "category", "available", "status"
+        ),
+        db.Index("ix_supplier_available_status", "available", "status"),
+        # ids are never reused, so a tombstone always means the same Supplier
+        {"sqlite_autoincrement": True},
+    )
 
     #gender = db.Column(
     #    db.Enum(Gender), nullable=False, server_default=(Gender.UNKNOWN.name)
@@ -84,15 +428,37 @@ class Supplier(db.Model):
     def __repr__(self):
         return "<Supplier %r id=[%s]>" % (self.name, self.id)
 
-    def create(self):
+    def create(self, idempotency_key: "IdempotencyKey" = None):
         """
         Creates a Supplier to the database
+
+        :param idempotency_key: a key that is saved in the same transaction,
+            so a retry with the key is answered without creating another Supplier
+        :type idempotency_key: IdempotencyKey
+
         """
         logger.info("Creating %s", self.name)
         # id must be none to generate next primary key
         self.id = None  # pylint: disable=invalid-name
-        db.session.add(self)
-        db.session.commit()
+        if write_batcher.enabled:
+            write_batcher.run(lambda session: self._insert(session, idempotency_key))
+        else:
+            try:
+                self._insert(db.session, idempotency_key)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        supplier_cache.invalidate(self.id)
+        stats_cache.clear()
+
+    def _insert(self, session, idempotency_key=None):
+        """Adds a Supplier and its Idempotency-Key to a session"""
+        session.add(self)
+        if idempotency_key is not None:
+            session.flush()
+            idempotency_key.remember(self)
+            session.add(idempotency_key)
 
     def update(self):
         """
@@ -101,13 +467,37 @@ class Supplier(db.Model):
         logger.info("Saving %s", self.name)
         if not self.id:
             raise DataValidationError("Update called with empty ID field")
-        db.session.commit()
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            raise
+        finally:
+            supplier_cache.invalidate(self.id)
+            stats_cache.clear()
 
     def delete(self):
         """Removes a Supplier from the data store"""
         logger.info("Deleting %s", self.name)
+        supplier_id = self.id
         db.session.delete(self)
         db.session.commit()
+        supplier_cache.invalidate(supplier_id)
+        stats_cache.clear()
+
+    @property
+    def etag(self) -> str:
+        """Returns a strong entity tag for the current version of a Supplier"""
+        return self.make_etag(self)
+
+    def refresh(self):
+        """Reloads a Supplier from the database, bypassing the cache"""
+        supplier_cache.invalidate(self.id)
+        db.session.refresh(self)
+
+    def row(self) -> dict:
+        """Returns the values of all of the columns of a Supplier"""
+        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
 
     def serialize(self) -> dict:
         """Serializes a Supplier into a dictionary"""
@@ -127,8 +517,8 @@ class Supplier(db.Model):
             data (dict): A dictionary containing the Supplier data
         """
         try:
-            self.name = data["name"]
-            self.category = data["category"]
+            self.name = self._check_string("name", data["name"])
+            self.category = self._check_string("category", data["category"])
             if isinstance(data["available"], bool):
                 self.available = data["available"]
             else:
@@ -137,7 +527,7 @@ class Supplier(db.Model):
                     + str(type(data["available"]))
                 )
         #     self.gender = getattr(Gender, data["gender"])  # create enum from string
-            self.status = data["status"]
+            self.status = self._check_string("status", data["status"])
         except AttributeError as error:
             raise DataValidationError("Invalid attribute: " + error.args[0])
         except KeyError as error:
@@ -152,19 +542,347 @@ class Supplier(db.Model):
     # CLASS METHODS
     ##################################################
 
+    @classmethod
+    def make_etag(cls, supplier, fields: tuple = None) -> str:
+        """Returns a strong entity tag for a Supplier or a row of its columns
+
+        :param supplier: a Supplier, or a row with its id and version columns
+        :type supplier: Supplier
+        :param fields: the fields in the representation, None for all of them
+        :type fields: tuple
+
+        :return: the entity tag of the representation
+        :rtype: str
+
+        """
+        etag = "{}-{}".format(supplier.id, supplier.version)
+        if fields is not None:
+            etag += "-" + ".".join(fields)
+        return etag
+
+    @classmethod
+    def collection_etag(cls, suppliers: list, fields: tuple = None) -> str:
+        """Returns a strong entity tag for a list of Suppliers
+
+        The tag is a digest of the id and version of every Supplier, so it
+        changes whenever one of them is added, changed or removed
+
+        :param suppliers: the Suppliers, or rows with their id and version columns
+        :type suppliers: list
+        :param fields: the fields in the representation, None for all of them
+        :type fields: tuple
+
+        :return: the entity tag of the list
+        :rtype: str
+
+        """
+        digest = hashlib.sha1()
+        if fields is not None:
+            digest.update("{};".format(".".join(fields)).encode())
+        for supplier in suppliers:
+            digest.update("{}-{},".format(supplier.id, supplier.version).encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def fieldset(cls, names: list) -> tuple:
+        """Validates the names of a sparse fieldset
+
+        :param names: the names of the fields a client asked for
+        :type names: list
+
+        :return: the fields to return, always starting with the id
+        :rtype: tuple
+
+        """
+        fields = ["id"]
+        for name in names:
+            if name not in cls.FIELDS and name != "id":
+                raise DataValidationError("Invalid field: " + name)
+            if name not in fields:
+                fields.append(name)
+        return tuple(fields)
+
+    @classmethod
+    def select_fields(cls, fields: tuple, query=None):
+        """Selects only some of the columns of the Suppliers of a query
+
+        The rows of the query are plain tuples, so no Supplier instances are
+        hydrated. The version column is always selected for the entity tags
+
+        :param fields: the fields to select, as returned by fieldset()
+        :type fields: tuple
+        :param query: the query to select from, defaults to all Suppliers
+        :type query: Query
+
+        :return: a query of the selected columns
+        :rtype: Query
+
+        """
+        logger.info("Processing column query for %s ...", fields)
+        if query is None:
+            query = cls.query
+        columns = [getattr(cls, name) for name in fields]
+        if "version" not in fields:
+            columns.append(cls.version)
+        return query.with_entities(*columns)
+
+    @staticmethod
+    def serialize_row(row, fields: tuple) -> dict:
+        """Serializes a row of selected columns into a dictionary"""
+        return {name: getattr(row, name) for name in fields}
+
+    @classmethod
+    def create_many(cls, suppliers: list, chunk_size: int = 1000) -> list:
+        """Creates many Suppliers in a single transaction
+
+        The rows are sent as multi-row INSERT statements that return the
+        new ids, so there is one round trip per chunk and a single commit
+
+        :param suppliers: the Suppliers to create
+        :type suppliers: list
+        :param chunk_size: the maximum number of rows in one INSERT statement
+        :type chunk_size: int
+
+        :return: the ids of the new Suppliers in the order they were given
+        :rtype: list
+
+        """
+        logger.info("Creating %d suppliers", len(suppliers))
+        table = cls.__table__
+        rows = [
+            {name: getattr(supplier, name) for name in cls.FIELDS} for supplier in suppliers
+        ]
+        ids = []
+        try:
+            if _supports_returning():
+                for start in range(0, len(rows), chunk_size):
+                    statement = (
+                        table.insert()
+                        .values(rows[start : start + chunk_size])
+                        .returning(table.c.id)
+                    )
+                    ids.extend(db.session.execute(statement).scalars())
+            else:
+                for row in rows:
+                    result = db.session.execute(table.insert().values(row))
+                    ids.append(result.inserted_primary_key[0])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        stats_cache.clear()
+        for supplier, supplier_id in zip(suppliers, ids):
+            supplier.id = supplier_id
+        return ids
+
+    @classmethod
+    def update_many(cls, query, changes: dict) -> int:
+        """Updates every Supplier matched by a query with one UPDATE statement
+
+        :param query: the query that selects the Suppliers to update
+        :type query: Query
+        :param changes: the new values by attribute name
+        :type changes: dict
+
+        :return: the number of Suppliers that were updated
+        :rtype: int
+
+        """
+        logger.info("Updating suppliers with %s", changes)
+        changes = dict(changes, version=cls.version + 1)
+        try:
+            count = query.update(changes, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        supplier_cache.clear()
+        stats_cache.clear()
+        return count
+
+    @classmethod
+    def update_by_id(cls, supplier_id: int, changes: dict, versions: list = None):
+        """Updates one Supplier with a single UPDATE that returns the new row
+
+        Nothing is loaded into the session, so the Supplier is changed in one
+        round trip when the database supports UPDATE ... RETURNING, and the
+        row is read back with a second statement when it does not
+
+        With WRITE_BATCHING the statement is committed by the write batcher
+        together with the writes of other requests
+
+        :param supplier_id: the id of the Supplier to update
+        :type supplier_id: int
+        :param changes: the validated new values by attribute name
+        :type changes: dict
+        :param versions: only update the Supplier if it has one of these versions
+        :type versions: list
+
+        :return: the updated row, or None if no Supplier matched
+        :rtype: Row
+
+        """
+        logger.info("Updating supplier %s with %s", supplier_id, changes)
+        table = cls.__table__
+        statement = (
+            table.update()
+            .where(table.c.id == supplier_id)
+            .values(dict(changes, version=table.c.version + 1))
+        )
+        if versions is not None:
+            statement = statement.where(table.c.version.in_(versions))
+        returning = _supports_returning()
+
+        def execute(session):
+            if returning:
+                return session.execute(statement.returning(*table.c)).first()
+            if session.execute(statement).rowcount:
+                return session.execute(table.select().where(table.c.id == supplier_id)).first()
+            return None
+
+        if write_batcher.enabled:
+            row = write_batcher.run(execute)
+        else:
+            try:
+                row = execute(db.session)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        supplier_cache.invalidate(supplier_id)
+        if row is not None:
+            stats_cache.clear()
+        return row
+
+    @classmethod
+    def delete_many(cls, query) -> int:
+        """Removes every Supplier matched by a query with one DELETE statement
+
+        :param query: the query that selects the Suppliers to remove
+        :type query: Query
+
+        :return: the number of Suppliers that were removed
+        :rtype: int
+
+        """
+        logger.info("Deleting suppliers")
+        count = cls._delete(query, synchronize_session=False)
+        supplier_cache.clear()
+        return count
+
+    @classmethod
+    def delete_by_id(cls, supplier_id: int, versions: list = None) -> int:
+        """Removes one Supplier with a single DELETE, without loading it first
+
+        :param supplier_id: the id of the Supplier to remove
+        :type supplier_id: int
+        :param versions: only remove the Supplier if it has one of these versions
+        :type versions: list
+
+        :return: the number of Suppliers that were removed, 0 or 1
+        :rtype: int
+
+        """
+        logger.info("Deleting supplier %s", supplier_id)
+        query = cls.query.filter(cls.id == supplier_id)
+        if versions is not None:
+            query = query.filter(cls.version.in_(versions))
+        # evaluate removes a Supplier that is in the session without a query
+        count = cls._delete(query, synchronize_session="evaluate")
+        supplier_cache.invalidate(supplier_id)
+        return count
+
+    @classmethod
+    def _delete(cls, query, synchronize_session) -> int:
+        """Runs the DELETE of a query in its own transaction and returns the row count"""
+        try:
+            count = query.delete(synchronize_session=synchronize_session)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if count:
+            stats_cache.clear()
+        return count
+
+    @classmethod
+    def validate_changes(cls, data: dict) -> dict:
+        """Validates a partial Supplier document
+
+        Only the attributes that are present are checked, so this can be used
+        for updates that change some of the fields of a Supplier
+
+        :param data: the attributes to change
+        :type data: dict
+
+        :return: the validated changes by attribute name
+        :rtype: dict
+
+        """
+        if not isinstance(data, dict) or not data:
+            raise DataValidationError(
+                "Invalid supplier: body of request contained bad or no data"
+            )
+        changes = {}
+        for name, value in data.items():
+            if name not in cls.FIELDS:
+                raise DataValidationError("Invalid attribute: " + str(name))
+            if name == "available":
+                if not isinstance(value, bool):
+                    raise DataValidationError(
+                        "Invalid type for boolean [available]: " + str(type(value))
+                    )
+            else:
+                cls._check_string(name, value)
+            changes[name] = value
+        return changes
+
+    @classmethod
+    def _check_string(cls, name: str, value) -> str:
+        """Checks that a value is a string that fits in the column of a field"""
+        if not isinstance(value, str):
+            raise DataValidationError(
+                "Invalid type for string [{}]: {}".format(name, type(value))
+            )
+        length = cls.__table__.c[name].type.length
+        if len(value) > length:
+            raise DataValidationError(
+                "Invalid value for [{}]: longer than {} characters".format(name, length)
+            )
+        return value
+
     @classmethod
     def init_db(cls, app: Flask):
-        """Initializes the database session
+        """Initializes the database session without connecting to the database
 
         :param app: the Flask app
         :type data: Flask
 
         """
         logger.info("Initializing database")
-        # This is where we initialize SQLAlchemy from the Flask app
+        supplier_cache.configure(
+            app.config.get("SUPPLIER_CACHE_SIZE", 1024),
+            app.config.get("SUPPLIER_CACHE_TTL", 30.0),
+        )
+        stats_cache.configure(stats_cache.maxsize, app.config.get("STATS_CACHE_TTL", 5.0))
+        write_batcher.configure(
+            app,
+            db.create_session({"expire_on_commit": False}),
+            enabled=app.config.get("WRITE_BATCHING", False),
+            max_items=app.config.get("WRITE_BATCH_SIZE", 100),
+            max_delay=app.config.get("WRITE_BATCH_DELAY", 0.005),
+            max_queue=app.config.get("WRITE_BATCH_QUEUE_SIZE", 1000),
+            timeout=app.config.get("WRITE_BATCH_TIMEOUT", 5.0),
+        )
+        # This is where we initialize SQLAlchemy from the Flask app, the
+        # engine connects on first use and the tables are made by db-init
         db.init_app(app)
-        app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+
+    @classmethod
+    def create_tables(cls):
+        """Creates the tables that do not exist yet"""
+        logger.info("Creating database tables")
+        db.create_all()
 
     @classmethod
     def all(cls) -> list:
@@ -172,10 +890,67 @@ class Supplier(db.Model):
         logger.info("Processing all Suppliers")
         return cls.query.all()
 
+    @classmethod
+    def stream(cls, query=None, batch_size: int = 1000):
+        """Iterates over Suppliers without loading them all into memory
+
+        Rows are fetched from a server-side cursor in batches, so memory use
+        stays flat no matter how many Suppliers there are
+
+        :param query: the query to iterate over, defaults to all Suppliers
+        :type query: Query
+        :param batch_size: the number of rows fetched from the cursor at a time
+        :type batch_size: int
+
+        :return: an iterator over the Suppliers ordered by id
+        :rtype: Query
+
+        """
+        logger.info("Processing streaming query ...")
+        if query is None:
+            query = cls.query
+        return query.order_by(cls.id).yield_per(batch_size)
+
+    @classmethod
+    def find_page(cls, query=None, cursor: int = None, limit: int = 100) -> tuple:
+        """Returns one page of Suppliers using keyset pagination
+
+        Suppliers are ordered by id and the page starts right after the
+        cursor, so the primary key index is used no matter how deep the
+        client pages
+
+        :param query: the query to page through, defaults to all Suppliers
+        :type query: Query
+        :param cursor: the id of the last Supplier of the previous page
+        :type cursor: int
+        :param limit: the maximum number of Suppliers on the page
+        :type limit: int
+
+        :return: the Suppliers on the page and the cursor of the next page,
+            which is None when this is the last page
+        :rtype: tuple
+
+        """
+        logger.info("Processing page query after id %s ...", cursor)
+        if query is None:
+            query = cls.query
+        if cursor is not None:
+            query = query.filter(cls.id > cursor)
+        # fetch one extra row to find out if there is a next page
+        suppliers = query.order_by(cls.id).limit(limit + 1).all()
+        next_cursor = None
+        if len(suppliers) > limit:
+            suppliers = suppliers[:limit]
+            next_cursor = suppliers[-1].id
+        return suppliers, next_cursor
+
     @classmethod
     def find(cls, supplier_id: int):
         """Finds a Supplier by it's ID
 
+        Rows are read through the supplier cache, so a cache hit returns an
+        instance attached to the session without going to the database
+
         :param supplier_id: the id of the supplier to find
         :type supplier_id: int
 
@@ -184,7 +959,19 @@ class Supplier(db.Model):
 
         """
         logger.info("Processing lookup for id %s ...", supplier_id)
-        return cls.query.get(supplier_id)
+        supplier = db.session.identity_map.get(identity_key(cls, supplier_id))
+        if supplier is not None and not inspect(supplier).expired:
+            return supplier
+        row = supplier_cache.get(supplier_id)
+        if row is not None:
+            supplier = cls(**row)
+            make_transient_to_detached(supplier)
+            return db.session.merge(supplier, load=False)
+        supplier = cls.query.get(supplier_id)
+        # a replica may lag behind the writes that emptied the cache
+        if supplier is not None and replica_bind() is None:
+            supplier_cache.set(supplier_id, supplier.row())
+        return supplier
 
     @classmethod
     def find_or_404(cls, supplier_id: int):
@@ -242,6 +1029,281 @@ class Supplier(db.Model):
         logger.info("Processing available query for %s ...", available)
         return cls.query.filter(cls.available == available)
 
+    @classmethod
+    def find_by_filters(
+        cls,
+        category: str = None,
+        name: str = None,
+        available: bool = None,
+        status: str = None,
+    ):
+        """Returns all Suppliers matching every filter that is given
+
+        The filters are combined into one query which is backed by the
+        composite indexes of the table
+
+        :param category: the category of the Suppliers you want to match
+        :type category: str
+        :param name: the name of the Suppliers you want to match
+        :type name: str
+        :param available: True for suppliers that are available
+        :type available: bool
+        :param status: the status of the Suppliers you want to match
+        :type status: str
+
+        :return: a collection of Suppliers matching all of the filters
+        :rtype: list
+
+        """
+        logger.info(
+            "Processing filter query for category=%s name=%s available=%s status=%s ...",
+            category,
+            name,
+            available,
+            status,
+        )
+        query = cls.query
+        if category is not None:
+            query = query.filter(cls.category == category)
+        if name is not None:
+            query = query.filter(cls.name == name)
+        if available is not None:
+            query = query.filter(cls.available == available)
+        if status is not None:
+            query = query.filter(cls.status == status)
+        return query
+
+    @classmethod
+    def stats(cls, **filters) -> dict:
+        """Returns the number of Suppliers by category, availability and status
+
+        The counts come from a single GROUP BY over the three columns, added
+        up per column, and are cached until the next write or for a few seconds
+
+        :param filters: the filters of find_by_filters() to count within
+        :type filters: dict
+
+        :return: the total and the counts of each value of each column
+        :rtype: dict
+
+        """
+        key = tuple(sorted(filters.items()))
+        stats = stats_cache.get(key)
+        if stats is not None:
+            return stats
+        logger.info("Processing stats query for %s ...", filters)
+        columns = (cls.category, cls.available, cls.status)
+        rows = (
+            cls.find_by_filters(**filters)
+            .with_entities(*columns, func.count())
+            .group_by(*columns)
+            .order_by(None)
+        )
+        stats = {"total": 0, "category": {}, "available": {}, "status": {}}
+        for category, available, status, count in rows:
+            stats["total"] += count
+            for counts, value in (
+                (stats["category"], category),
+                (stats["available"], "true" if available else "false"),
+                (stats["status"], status),
+            ):
+                counts[value] = counts.get(value, 0) + count
+        if replica_bind() is None:
+            stats_cache.set(key, stats)
+        return stats
+
+    @classmethod
+    def changed_since(cls, revision: int, settle_seconds: float = 1.0, limit: int = None) -> tuple:
+        """Returns the Suppliers changed and deleted after a revision
+
+        The rows are found with the revision indexes, so the cost grows with
+        the number of changes and not with the number of Suppliers. Changes
+        made in the last settle_seconds are left for the next sync, together
+        with every change after them, because a transaction that took an
+        earlier revision may not have committed yet. With a limit only the
+        first changes by revision are returned, and the high-water mark is
+        the revision of the last one. A page never ends inside a revision,
+        so it has more than limit changes when one statement changed more
+
+        :param revision: the high-water mark of the last sync, 0 for all
+        :type revision: int
+        :param settle_seconds: how long a change waits before it is synced
+        :type settle_seconds: float
+        :param limit: the maximum number of changes to return, None for all
+        :type limit: int
+
+        :return: the new high-water mark, the changed Suppliers and the ids
+            of the deleted Suppliers
+        :rtype: tuple
+
+        """
+        logger.info("Processing changes since revision %s ...", revision)
+        tombstone = SupplierTombstone
+        cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+        unsettled = [
+            select(func.min(cls.revision)).where(
+                cls.revision > revision, cls.updated_at > cutoff
+            ),
+            select(func.min(tombstone.revision)).where(
+                tombstone.revision > revision, tombstone.deleted_at > cutoff
+            ),
+        ]
+        limits = [
+            limit for limit in db.session.execute(unsettled[0].union_all(unsettled[1])).scalars()
+            if limit is not None
+        ]
+        suppliers = cls.query.filter(cls.revision > revision)
+        deleted = db.session.query(tombstone.supplier_id, tombstone.revision).filter(
+            tombstone.revision > revision
+        )
+        if limits:
+            suppliers = suppliers.filter(cls.revision < min(limits))
+            deleted = deleted.filter(tombstone.revision < min(limits))
+        suppliers_query = suppliers.order_by(cls.revision, cls.id)
+        deleted_query = deleted.order_by(tombstone.revision, tombstone.supplier_id)
+        if limit is None:
+            suppliers = suppliers_query.all()
+            deleted = deleted_query.all()
+        else:
+            suppliers = suppliers_query.limit(limit).all()
+            deleted = deleted_query.limit(limit).all()
+        if limit is not None and len(suppliers) + len(deleted) >= limit:
+            # a set-based write can give all of its rows one revision, so the
+            # page ends after every row of its last revision, even past limit
+            revisions = sorted(
+                [supplier.revision for supplier in suppliers] + [row.revision for row in deleted]
+            )
+            last = revisions[limit - 1]
+            suppliers = [supplier for supplier in suppliers if supplier.revision < last]
+            suppliers += suppliers_query.filter(cls.revision == last).all()
+            deleted = [row for row in deleted if row.revision < last]
+            deleted += deleted_query.filter(tombstone.revision == last).all()
+        high_water = max(
+            [revision]
+            + [supplier.revision for supplier in suppliers[-1:]]
+            + [row.revision for row in deleted[-1:]]
+        )
+        return high_water, suppliers, [row.supplier_id for row in deleted]
+
+    @classmethod
+    def search(
+        cls,
+        text: str,
+        query=None,
+        cursor: tuple = None,
+        limit: int = 100,
+        candidates: int = 500,
+    ) -> tuple:
+        """Returns one page of the Suppliers whose name matches a search, best first
+
+        Names equal to the search rank first, then names that start with it,
+        then names with a word that starts with it, then any other match.
+        Within a rank the closest names come first, by trigram similarity with
+        pg_trgm and by the number of extra characters otherwise. The matches
+        are found with a trigram index on PostgreSQL (or a prefix index when
+        pg_trgm is not installed) and an FTS5 trigram table on SQLite.
+        Searches shorter than three characters only match prefixes
+
+        Only a bounded set of candidates is ranked: the first names that start
+        with the search in the order of the prefix index, and the first other
+        matches by id. A search that matches more names than that returns the
+        best of the candidates and should be narrowed to find the rest
+
+        :param text: the text to search for in the names
+        :type text: str
+        :param query: the query to search in, defaults to all Suppliers
+        :type query: Query
+        :param cursor: the rank, distance and id of the last Supplier of the
+            previous page
+        :type cursor: tuple
+        :param limit: the maximum number of Suppliers on the page
+        :type limit: int
+        :param candidates: the maximum number of prefix matches and of other
+            matches that are ranked
+        :type candidates: int
+
+        :return: the Suppliers (or rows) on the page and the cursor of the
+            next page, which is None when this is the last page
+        :rtype: tuple
+
+        """
+        logger.info("Processing search for %s after %s ...", text, cursor)
+        if query is None:
+            query = cls.query
+        term = text.lower()
+        name = func.lower(cls.name)
+        backend = search_backend()
+        candidates = max(candidates, limit + 1)
+        # a range of the prefix index, which is in the C collation on PostgreSQL
+        # so that a range is a prefix and the index returns the names in order
+        sort_name = name if db.engine.dialect.name == "sqlite" else collate(name, "C")
+        prefix = and_(sort_name >= term, sort_name < term + "\U0010ffff")
+        if backend == "pg_trgm" and len(term) >= 3:
+            match = or_(name.contains(term, autoescape=True), name.op("%")(term))
+        elif backend == "fts5" and len(term) >= 3:
+            phrase = '"{}"'.format(term.replace('"', '""'))
+            # FTS5 returns its matches by rowid, so it stops after the candidates
+            match = cls.id.in_(
+                select(column("rowid"))
+                .select_from(table("supplier_search"))
+                .where(text_clause("supplier_search MATCH :phrase").bindparams(phrase=phrase))
+                .order_by(column("rowid"))
+                .limit(candidates)
+            )
+        else:
+            match = prefix
+        rank = case(
+            (name == term, 0),
+            (prefix, 1),
+            (name.contains(" " + term, autoescape=True), 2),
+            else_=3,
+        ).label("search_rank")
+        # an integer, so the cursor compares equal to the value it came from
+        if backend == "pg_trgm":
+            distance = cast((1 - func.similarity(name, term)) * 1000, db.Integer)
+        else:
+            distance = func.abs(func.length(name) - len(term))
+        distance = distance.label("search_distance")
+        # the candidates are read in index order and cut before any are ranked
+        pool = cls._search_candidates(query, prefix, sort_name, candidates)
+        if match is not prefix:
+            pool = union(pool, cls._search_candidates(query, match, cls.id, candidates))
+        query = query.filter(cls.id.in_(pool)).add_columns(rank, distance)
+        if cursor is not None:
+            last_rank, last_distance, last_id = cursor
+            query = query.filter(
+                or_(
+                    rank > last_rank,
+                    and_(
+                        rank == last_rank,
+                        or_(
+                            distance > last_distance,
+                            and_(distance == last_distance, cls.id > last_id),
+                        ),
+                    ),
+                )
+            )
+        # fetch one extra row to find out if there is a next page
+        rows = query.order_by(rank, distance, cls.id).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = (
+                last.search_rank,
+                last.search_distance,
+                last.id if "id" in last.keys() else last[0].id,
+            )
+        if rows and isinstance(rows[0][0], cls):
+            rows = [row[0] for row in rows]
+        return rows, next_cursor
+
+    @classmethod
+    def _search_candidates(cls, query, match, order, limit: int):
+        """Returns a select of the ids of the first Suppliers of a query that match"""
+        ids = query.filter(match).with_entities(cls.id.label("id"))
+        return select(ids.order_by(order, cls.id).limit(limit).subquery().c.id)
+
     # @classmethod
     # def find_by_gender(cls, gender: Gender = Gender.UNKNOWN) -> list:
     #     """Returns all Pets by their Gender
@@ -255,3 +1317,445 @@ class Supplier(db.Model):
     #     """
     #     logger.info("Processing gender query for %s ...", gender.name)
     #     return cls.query.filter(cls.gender == gender)
+
+
+class IdempotencyKey(db.Model):
+    """
+    Class that represents the Idempotency-Key of a request that created a Supplier
+
+    The response of the request is kept with the key, so a retry of the
+    request is answered with a single read by primary key and never touches
+    the supplier table. Keys expire and are removed by sweep()
+    """
+
+    ##################################################
+    # Table Schema
+    ##################################################
+    key = db.Column(db.String(255), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    supplier_id = db.Column(db.Integer, nullable=False)
+    etag = db.Column(db.String(63), nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    content_type = db.Column(db.String(127), nullable=False, default="application/json")
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    # The longest Idempotency-Key header that is accepted
+    MAX_LENGTH = 255
+
+    # When the expired keys of this worker were last removed
+    last_sweep = time.monotonic()
+
+    def __repr__(self):
+        return "<IdempotencyKey %r supplier_id=[%s]>" % (self.key, self.supplier_id)
+
+    def remember(self, supplier: Supplier):
+        """Keeps the response of the request that created a Supplier
+
+        The body is rendered with jsonify() and kept with its content type,
+        and the request itself is answered with them, so every retry gets
+        the same bytes as the first response
+        """
+        response = jsonify(supplier.serialize())
+        self.supplier_id = supplier.id
+        self.etag = supplier.etag
+        self.response = response.get_data(as_text=True)
+        self.content_type = response.content_type
+
+    @staticmethod
+    def hash_request(data) -> str:
+        """Returns a digest of a JSON request body that ignores the order of its keys"""
+        body = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def find(cls, key: str):
+        """Finds an Idempotency-Key by its primary key
+
+        :param key: the value of the Idempotency-Key header
+        :type key: str
+
+        :return: the key with the response it was used for, or None
+        :rtype: IdempotencyKey
+
+        """
+        return db.session.get(cls, key)
+
+    @classmethod
+    def sweep(cls, ttl: float) -> int:
+        """Removes the keys that are older than the ttl
+
+        :param ttl: the number of seconds a key is kept
+        :type ttl: float
+
+        :return: the number of keys that were removed
+        :rtype: int
+
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+        try:
+            count = cls.query.filter(cls.created_at < cutoff).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        cls.last_sweep = time.monotonic()
+        if count:
+            logger.info("Removed %d expired idempotency keys", count)
+        return count
+
+    @classmethod
+    def sweep_if_due(cls, ttl: float, interval: float) -> int:
+        """Removes the expired keys if this worker has not done so for an interval"""
+        if time.monotonic() - cls.last_sweep < interval:
+            return 0
+        cls.last_sweep = time.monotonic()
+        return cls.sweep(ttl)
+
+
+class SupplierChange(db.Model):
+    """
+    Class that represents a change to a Supplier in the change log
+
+    The rows are written by triggers on the supplier table, so every create,
+    update and delete is logged in the same statement, including the set-based
+    ones. The ids of the changes are the event ids of the change feed. Only
+    the latest CHANGE_LOG_SIZE changes are kept: the change feed removes the
+    older ones with trim(), outside of the transactions of the writes, and
+    SQLite also trims the log with a trigger as its writes are serialized
+    """
+
+    ##################################################
+    # Table Schema
+    ##################################################
+    id = db.Column(db.Integer, primary_key=True)
+    supplier_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(15), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+
+    # ids are never reused, so a client can resume after the last one it saw
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    # The actions the triggers log
+    ACTIONS = ("create", "update", "disable", "enable", "delete")
+
+    # When the change log was last trimmed by this worker
+    last_trim = time.monotonic()
+
+    def __repr__(self):
+        return "<SupplierChange %s %s id=[%s]>" % (self.action, self.supplier_id, self.id)
+
+    @classmethod
+    def last_id(cls) -> int:
+        """Returns the id of the latest change, or 0 if nothing has changed"""
+        return db.session.query(func.coalesce(func.max(cls.id), 0)).scalar()
+
+    @classmethod
+    def trim(cls, size: int) -> int:
+        """Removes all but the latest changes from the change log
+
+        The DELETE runs on the primary in a transaction of its own, so the
+        writers of Suppliers never wait for each other to remove the same
+        old changes
+
+        :param size: the number of changes to keep
+        :type size: int
+
+        :return: the number of changes that were removed
+        :rtype: int
+
+        """
+        change = cls.__table__
+        latest = select(func.max(change.c.id)).scalar_subquery()
+        with db.engine.begin() as connection:
+            count = connection.execute(change.delete().where(change.c.id <= latest - size)).rowcount
+        cls.last_trim = time.monotonic()
+        if count:
+            logger.info("Removed %d changes from the change log", count)
+        return count
+
+    @classmethod
+    def trim_if_due(cls, size: int, interval: float) -> int:
+        """Trims the change log if this worker has not done so for an interval"""
+        if time.monotonic() - cls.last_trim < interval:
+            return 0
+        cls.last_trim = time.monotonic()
+        return cls.trim(size)
+
+    @classmethod
+    def first_id(cls) -> int:
+        """Returns the id of the oldest change that is still kept, or None"""
+        return db.session.query(func.min(cls.id)).scalar()
+
+    @classmethod
+    def since(cls, last_id: int, limit: int = 100, settle_seconds: float = 0.0) -> list:
+        """Returns the changes after an id with the current values of their Suppliers
+
+        A single query joins the log with the supplier table, so the columns
+        of a Supplier that has since been deleted are None. The ids are taken
+        when a change is made and not when it is committed, so changes made
+        in the last settle_seconds are left for later, together with every
+        change after them, as a client never goes back to an id it passed
+
+        :param last_id: the id of the last change the client has seen
+        :type last_id: int
+        :param limit: the maximum number of changes to return
+        :type limit: int
+        :param settle_seconds: how long a change waits before it is returned
+        :type settle_seconds: float
+
+        :return: rows of the change id and action and the Supplier columns
+        :rtype: list
+
+        """
+        supplier = Supplier.__table__
+        change = cls.__table__
+        cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+        unsettled = (
+            select(func.min(change.c.id))
+            .where(change.c.id > last_id, change.c.created_at > cutoff)
+            .scalar_subquery()
+        )
+        statement = (
+            select(change.c.id, change.c.supplier_id, change.c.action, *list(supplier.c)[1:])
+            .select_from(change.outerjoin(supplier, supplier.c.id == change.c.supplier_id))
+            .where(change.c.id > last_id, or_(unsettled.is_(None), change.c.id < unsettled))
+            .order_by(change.c.id)
+            .limit(limit)
+        )
+        return db.session.execute(statement).all()
+
+
+class SupplierTombstone(db.Model):
+    """
+    Class that represents a deleted Supplier
+
+    A trigger on the supplier table writes a tombstone with the next revision
+    for every Supplier that is deleted, so a delta sync can tell its clients
+    to remove them
+    """
+
+    ##################################################
+    # Table Schema
+    ##################################################
+    supplier_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    revision = db.Column(db.BigInteger, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return "<SupplierTombstone id=[%s] revision=[%s]>" % (self.supplier_id, self.revision)
+
+
+######################################################################
+#  S E A R C H   I N D E X E S
+######################################################################
+# The search backend of each database, found when it is first searched
+_search_backends = {}
+
+
+def search_backend() -> str:
+    """Returns how the names of the Suppliers can be searched in this database
+
+    pg_trgm for a trigram index on PostgreSQL, fts5 for an FTS5 trigram
+    table on SQLite, or prefix for a prefix index only
+
+    """
+    engine = db.engine
+    backend = _search_backends.get(engine.url)
+    if backend is None:
+        with engine.connect() as conn:
+            if engine.dialect.name == "postgresql":
+                installed = conn.execute(
+                    text_clause("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                ).first()
+                backend = "pg_trgm" if installed else "prefix"
+            elif engine.dialect.name == "sqlite":
+                found = conn.execute(
+                    text_clause("SELECT 1 FROM sqlite_master WHERE name = 'supplier_search'")
+                ).first()
+                backend = "fts5" if found else "prefix"
+            else:
+                backend = "prefix"
+        _search_backends[engine.url] = backend
+    return backend
+
+
+@event.listens_for(Supplier.__table__, "after_create")
+def create_search_indexes(target, connection, **kw):
+    """Creates the indexes used to search the names of the Suppliers"""
+    _search_backends.clear()
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        # the name is included so the candidates of a search are read from the
+        # index alone, whatever the planner estimates for a short prefix
+        connection.execute(
+            DDL(
+                "CREATE INDEX IF NOT EXISTS ix_supplier_name_prefix "
+                'ON supplier (lower(name) COLLATE "C", id) INCLUDE (name)'
+            )
+        )
+        available = connection.execute(
+            text_clause("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        ).first()
+        if not available:
+            logger.warning("pg_trgm is not installed, names can only be searched by prefix")
+            return
+        connection.execute(DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        connection.execute(
+            DDL(
+                "CREATE INDEX IF NOT EXISTS ix_supplier_name_trgm "
+                "ON supplier USING gin (lower(name) gin_trgm_ops)"
+            )
+        )
+    elif dialect == "sqlite":
+        connection.execute(
+            DDL("CREATE INDEX IF NOT EXISTS ix_supplier_name_lower ON supplier (lower(name))")
+        )
+        if connection.dialect.dbapi.sqlite_version_info < (3, 34, 0):
+            logger.warning("SQLite has no FTS5 trigrams, names can only be searched by prefix")
+            return
+        for statement in (
+            "CREATE VIRTUAL TABLE supplier_search USING fts5("
+            "name, content='supplier', content_rowid='id', tokenize='trigram')",
+            "CREATE TRIGGER supplier_search_insert AFTER INSERT ON supplier BEGIN "
+            "INSERT INTO supplier_search (rowid, name) VALUES (new.id, new.name); END",
+            "CREATE TRIGGER supplier_search_delete AFTER DELETE ON supplier BEGIN "
+            "INSERT INTO supplier_search (supplier_search, rowid, name) "
+            "VALUES ('delete', old.id, old.name); END",
+            "CREATE TRIGGER supplier_search_update AFTER UPDATE OF name ON supplier BEGIN "
+            "INSERT INTO supplier_search (supplier_search, rowid, name) "
+            "VALUES ('delete', old.id, old.name); "
+            "INSERT INTO supplier_search (rowid, name) VALUES (new.id, new.name); END",
+        ):
+            connection.execute(DDL(statement))
+
+
+@event.listens_for(Supplier.__table__, "before_drop")
+def drop_search_indexes(target, connection, **kw):
+    """Drops the search table that is not part of the metadata"""
+    _search_backends.clear()
+    if connection.dialect.name == "sqlite":
+        connection.execute(DDL("DROP TABLE IF EXISTS supplier_search"))
+
+
+######################################################################
+#  C H A N G E   L O G
+######################################################################
+# The number of changes the log keeps when CHANGE_LOG_SIZE is not configured
+DEFAULT_CHANGE_LOG_SIZE = 10000
+
+
+def change_log_ddl(dialect: str, size: int) -> list:
+    """Returns the statements that create the change log triggers of a database"""
+    if dialect == "postgresql":
+        # statement triggers log a set-based change with a single INSERT, at
+        # the time the ids are taken rather than when the transaction began.
+        # The log is trimmed by SupplierChange.trim(), as concurrent writers
+        # would wait on each other to delete the same oldest changes
+        logged = {
+            "INSERT": "SELECT id, 'create', {} FROM new_rows ORDER BY id",
+            "DELETE": "SELECT id, 'delete', {} FROM old_rows ORDER BY id",
+            "UPDATE": "SELECT new_rows.id, CASE "
+            "WHEN new_rows.status IS DISTINCT FROM old_rows.status "
+            "AND new_rows.status = 'disabled' THEN 'disable' "
+            "WHEN new_rows.status IS DISTINCT FROM old_rows.status "
+            "AND new_rows.status = 'enabled' THEN 'enable' "
+            "ELSE 'update' END, {} "
+            "FROM new_rows JOIN old_rows ON old_rows.id = new_rows.id ORDER BY new_rows.id",
+        }
+        transitions = {
+            "INSERT": "NEW TABLE AS new_rows",
+            "DELETE": "OLD TABLE AS old_rows",
+            "UPDATE": "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+        }
+        statements = []
+        for operation, rows in logged.items():
+            name = "supplier_change_{}".format(operation.lower())
+            statements += [
+                "CREATE OR REPLACE FUNCTION {}() RETURNS trigger AS $$ BEGIN "
+                "INSERT INTO supplier_change (supplier_id, action, created_at) {}; "
+                "RETURN NULL; END $$ LANGUAGE plpgsql".format(
+                    name, rows.format("clock_timestamp() AT TIME ZONE 'UTC'")
+                ),
+                "DROP TRIGGER IF EXISTS {} ON supplier".format(name),
+                "CREATE TRIGGER {} AFTER {} ON supplier REFERENCING {} "
+                "FOR EACH STATEMENT EXECUTE PROCEDURE {}()".format(
+                    name, operation, transitions[operation], name
+                ),
+            ]
+        return statements
+    if dialect == "sqlite":
+        return [
+            "DROP TRIGGER IF EXISTS supplier_change_insert",
+            "CREATE TRIGGER supplier_change_insert AFTER INSERT ON supplier BEGIN "
+            "INSERT INTO supplier_change (supplier_id, action) VALUES (new.id, 'create'); END",
+            "DROP TRIGGER IF EXISTS supplier_change_update",
+            "CREATE TRIGGER supplier_change_update AFTER UPDATE ON supplier BEGIN "
+            "INSERT INTO supplier_change (supplier_id, action) VALUES (new.id, CASE "
+            "WHEN new.status IS NOT old.status AND new.status = 'disabled' THEN 'disable' "
+            "WHEN new.status IS NOT old.status AND new.status = 'enabled' THEN 'enable' "
+            "ELSE 'update' END); END",
+            "DROP TRIGGER IF EXISTS supplier_change_delete",
+            "CREATE TRIGGER supplier_change_delete AFTER DELETE ON supplier BEGIN "
+            "INSERT INTO supplier_change (supplier_id, action) VALUES (old.id, 'delete'); END",
+            # the oldest changes are removed after every 100 changes
+            "CREATE TRIGGER supplier_change_trim AFTER INSERT ON supplier_change "
+            "WHEN new.id - (new.id / 100) * 100 = 0 BEGIN "
+            "DELETE FROM supplier_change WHERE id <= new.id - {}; END".format(size),
+        ]
+    return []
+
+
+@event.listens_for(db.Model.metadata, "after_create")
+def create_change_log_triggers(target, connection, tables=(), **kw):
+    """Logs the changes to the supplier table once the change log table is made"""
+    if SupplierChange.__table__ not in tables:
+        return
+    size = DEFAULT_CHANGE_LOG_SIZE
+    if has_app_context():
+        size = int(current_app.config.get("CHANGE_LOG_SIZE", size))
+    for statement in change_log_ddl(connection.dialect.name, size):
+        # DDL formats the statement with %, which the triggers do not use
+        connection.execute(DDL(statement.replace("%", "%%")))
+
+
+######################################################################
+#  T O M B S T O N E S
+######################################################################
+def tombstone_ddl(dialect: str) -> list:
+    """Returns the statements that create the tombstone trigger of a database"""
+    if dialect == "postgresql":
+        return [
+            "CREATE OR REPLACE FUNCTION supplier_tombstone() RETURNS trigger AS $$ BEGIN "
+            "INSERT INTO supplier_tombstone (supplier_id, revision, deleted_at) "
+            "SELECT id, nextval('{}'), timezone('utc', clock_timestamp()) "
+            "FROM old_rows ORDER BY id "
+            "ON CONFLICT (supplier_id) DO UPDATE "
+            "SET revision = EXCLUDED.revision, deleted_at = EXCLUDED.deleted_at; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql".format(revision_sequence.name),
+            "DROP TRIGGER IF EXISTS supplier_tombstone ON supplier",
+            "CREATE TRIGGER supplier_tombstone AFTER DELETE ON supplier "
+            "REFERENCING OLD TABLE AS old_rows "
+            "FOR EACH STATEMENT EXECUTE PROCEDURE supplier_tombstone()",
+        ]
+    if dialect == "sqlite":
+        return [
+            "DROP TRIGGER IF EXISTS supplier_tombstone",
+            # before the delete, so the revision is counted from the deleted row too
+            "CREATE TRIGGER supplier_tombstone BEFORE DELETE ON supplier BEGIN "
+            "INSERT OR REPLACE INTO supplier_tombstone (supplier_id, revision, deleted_at) "
+            "VALUES (old.id, {}, strftime('%Y-%m-%d %H:%M:%f', 'now')); END".format(
+                NEXT_REVISION_SQL
+            ),
+        ]
+    return []
+
+
+@event.listens_for(db.Model.metadata, "after_create")
+def create_tombstone_trigger(target, connection, tables=(), **kw):
+    """Writes the tombstones of deleted Suppliers once their table is made"""
+    if SupplierTombstone.__table__ not in tables:
+        return
+    for statement in tombstone_ddl(connection.dialect.name):
+        connection.execute(DDL(statement.replace("%", "%%")))
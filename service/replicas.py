@@ -0,0 +1,105 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: replicas
+
+Routing of read-only requests to read replicas
+
+When DATABASE_REPLICA_URIS is set, every replica becomes an SQLAlchemy bind
+and the GET and HEAD requests take turns reading from them. All other
+requests use the primary database. A client that has just written gets a
+cookie that keeps its reads on the primary for REPLICA_READ_YOUR_WRITES_SECONDS,
+so it never reads a replica that has not caught up with its own writes.
+"""
+import time
+import itertools
+import threading
+from flask import g, request
+from . import app
+
+READ_METHODS = ("GET", "HEAD")
+WRITE_COOKIE = "primary_until"
+
+# The bind keys of the replicas and the order in which requests use them
+replica_binds = []
+_next_replica = itertools.cycle(replica_binds)
+_lock = threading.Lock()
+
+
+def init_replicas(flask_app):
+    """Adds a bind for every replica in DATABASE_REPLICA_URIS of the Flask app"""
+    global _next_replica  # pylint: disable=global-statement
+    binds = {
+        name: uri
+        for name, uri in (flask_app.config.get("SQLALCHEMY_BINDS") or {}).items()
+        if name not in replica_binds
+    }
+    replica_binds.clear()
+    for index, uri in enumerate(flask_app.config.get("DATABASE_REPLICA_URIS") or []):
+        name = "replica_{}".format(index)
+        binds[name] = uri
+        replica_binds.append(name)
+    flask_app.config["SQLALCHEMY_BINDS"] = binds or None
+    with _lock:
+        _next_replica = itertools.cycle(list(replica_binds))
+    if replica_binds:
+        flask_app.logger.info("Reading from %d database replicas", len(replica_binds))
+
+
+def choose_replica():
+    """Returns the bind key of the next replica, or None if there are none"""
+    if not replica_binds:
+        return None
+    with _lock:
+        return next(_next_replica)
+
+
+def wrote_recently() -> bool:
+    """Returns True if the client wrote within the read-your-writes window"""
+    try:
+        return float(request.cookies.get(WRITE_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+######################################################################
+#  R E Q U E S T   H O O K S
+######################################################################
+@app.before_request
+def route_request():
+    """Sends the queries of a read-only request to a replica"""
+    g.db_replica = None
+    if request.method in READ_METHODS and not wrote_recently():
+        g.db_replica = choose_replica()
+
+
+@app.after_request
+def remember_write(response):
+    """Keeps the reads of a client that wrote on the primary for a while"""
+    if replica_binds and request.method not in READ_METHODS and response.status_code < 400:
+        window = app.config.get("REPLICA_READ_YOUR_WRITES_SECONDS", 5.0)
+        response.set_cookie(
+            WRITE_COOKIE,
+            "{:.3f}".format(time.time() + window),
+            max_age=int(window) + 1,
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+@app.teardown_request
+def forget_replica(_error=None):
+    """Sends the queries outside of requests to the primary again"""
+    g.pop("db_replica", None)
@@ -18,18 +18,51 @@ Supplier Resource Service
 Paths:
 ------
 GET /suppliers - Returns a list all of the Suppliers
+GET /suppliers?category={c}&name={n}&availability={a}&status={s} - Returns the matching Suppliers
+GET /suppliers?limit={n}&cursor={id} - Returns a page of Suppliers after the cursor
+GET /suppliers?q={text} - Returns a page of the Suppliers whose names match, best first
+GET /suppliers?since={revision} - Returns the Suppliers changed and deleted after a revision
+GET /suppliers (Accept: application/x-ndjson) - Streams all of the Suppliers
 GET /suppliers/{id} - Returns the Supplier with a given id number
+GET /suppliers/stats?category={c}&... - Returns the number of Suppliers by category, etc.
+GET /suppliers/changes (Last-Event-ID: {id}) - Streams the Supplier changes as Server-Sent Events
+GET /suppliers?fields={f1},{f2} - Returns only some of the fields of the Suppliers
+
+GET requests answer If-None-Match with 304 Not Modified and the PUT requests
+honor If-Match using the ETag of the row version
 POST /suppliers - creates a new Supplier record in the database
+POST /suppliers (Idempotency-Key: {key}) - answers a retry with the response of the first request
+POST /suppliers/bulk - creates many Supplier records in a single transaction
 PUT /suppliers/{id} - updates a Supplier record in the database
+PATCH /suppliers/{id} - updates only the given fields of a Supplier record
 DELETE /suppliers/{id} - deletes a Supplier record in the database
+PATCH /suppliers?id={id}&... - updates the Supplier records matching the ids or filters
+DELETE /suppliers?id={id}&... - deletes the Supplier records matching the ids or filters
+PUT /suppliers/{id}/disable - disables a Supplier, PUT /suppliers/{id}/enable enables it
+PUT /suppliers/disable?id={id}&... - disables the Supplier records matching the ids or filters
+PUT /suppliers/enable?id={id}&... - enables the Supplier records matching the ids or filters
+GET /metrics - Returns the metrics of all workers in the Prometheus text format
 """
-
-from flask import jsonify, request, url_for, make_response, abort
+import time
+import threading
+from flask import jsonify, json, request, url_for, make_response, abort
+from flask import Response, stream_with_context
 from werkzeug.exceptions import NotFound
-from service.models import Supplier
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from service.models import Supplier, SupplierChange, IdempotencyKey, DataValidationError, db
+from service.metrics import registry
+from service.encoders import row_encoder
 from . import status  # HTTP Status Codes
 from . import app  # Import Flask application
 
+NDJSON = "application/x-ndjson"
+EVENT_STREAM = "text/event-stream"
+
+# The change streams that are open in this worker
+open_streams = {"count": 0}
+open_streams_lock = threading.Lock()
+
 ######################################################################
 # GET INDEX
 ######################################################################
@@ -47,30 +80,324 @@ def index():
     # ) 
     return app.send_static_file("index.html")
 
+######################################################################
+# METRICS
+######################################################################
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Returns the request, database and cache metrics in the Prometheus text format"""
+    return app.response_class(
+        registry.render(), status.HTTP_200_OK, mimetype="text/plain; version=0.0.4"
+    )
+
+
 ######################################################################
 # LIST ALL SUPPLIERS
 ######################################################################
 @app.route("/suppliers", methods=["GET"])
 def list_suppliers():
-    """Returns all of the Suppliers"""
+    """
+    Returns all of the Suppliers
+
+    With a since revision only the Suppliers changed after it and the ids of
+    the ones deleted after it are returned, with the new high-water mark to
+    send as since next time. When a limit or cursor is given only one page of
+    Suppliers is returned and the cursor of the next page is sent back in the
+    X-Next-Cursor and Link headers. A q parameter searches the names of the
+    Suppliers and returns one page of the matches, best first. Clients that
+    accept application/x-ndjson get every matching Supplier streamed back one
+    JSON document per line instead. A fields parameter limits the Suppliers
+    to a comma separated list of fields
+    """
     app.logger.info("Request for supplier list")
-    suppliers = []
-    category = request.args.get("category")
-    name = request.args.get("name")
-    availability = request.args.get("availability")
-
-    if category:
-        suppliers = Supplier.find_by_category(category)
-    elif name:
-        suppliers = Supplier.find_by_name(name)
-    elif availability:
-        suppliers = Supplier.find_by_availability(availability)
+    since = get_int_arg("since")
+    if since is not None:
+        return sync_suppliers(since)
+    search = request.args.get("q", "").strip()
+    fields = get_fields_arg()
+    fast = use_fast_serialization()
+    # the fast path reads plain rows of columns instead of Supplier instances
+    columns = fields
+    if fast and columns is None:
+        columns = Supplier.fieldset(Supplier.FIELDS)
+    query = filter_suppliers()
+    if columns is not None:
+        query = Supplier.select_fields(columns, query)
+
+    accept = request.accept_mimetypes.best_match(["application/json", NDJSON])
+    if accept == NDJSON and not search:
+        return stream_suppliers(query, columns)
+
+    if search:
+        suppliers, headers = search_suppliers(search, query)
     else:
-        suppliers = Supplier.all()
+        suppliers, headers = page_suppliers(query)
+    suppliers = list(suppliers)
+    etag = Supplier.collection_etag(suppliers, fields)
+    if request.if_none_match.contains_weak(etag):
+        app.logger.info("Supplier list not modified")
+        return not_modified(etag, headers)
+
+    app.logger.info("Returning %d suppliers", len(suppliers))
+    response = encode_suppliers(suppliers, columns if fast else None, fields, headers)
+    response.set_etag(etag)
+    return response
+
+
+def encode_suppliers(suppliers, encoded_columns, fields, headers):
+    """Returns a response with a JSON array of Suppliers or rows of their columns
+
+    Rows of encoded_columns are encoded straight to JSON, without making a
+    dictionary of each row first
+    """
+    if encoded_columns is not None:
+        encoder = row_encoder(
+            encoded_columns, app.config["JSON_AS_ASCII"], app.config["JSON_SORT_KEYS"]
+        )
+        return app.response_class(
+            encoder.encode(suppliers),
+            status.HTTP_200_OK,
+            headers,
+            mimetype=app.config["JSONIFY_MIMETYPE"],
+        )
+    if fields is None:
+        results = [supplier.serialize() for supplier in suppliers]
+    else:
+        results = [Supplier.serialize_row(row, fields) for row in suppliers]
+    return make_response(jsonify(results), status.HTTP_200_OK, headers)
+
+
+def search_suppliers(search, query):
+    """Returns one page of the Suppliers whose names match a search and its headers"""
+    limit = get_page_size()
+    suppliers, next_cursor = Supplier.search(search, query, get_search_cursor(), limit)
+    if next_cursor is not None:
+        next_cursor = "{}-{}-{}".format(*next_cursor)
+    return suppliers, next_page_headers(next_cursor, limit)
+
+
+def page_suppliers(query):
+    """Returns the Suppliers of a query, or one page of them, and the headers"""
+    cursor = get_int_arg("cursor")
+    if cursor is None and "limit" not in request.args:
+        return (Supplier.all() if query is None else query), {}
+    limit = get_page_size()
+    suppliers, next_cursor = Supplier.find_page(query, cursor, limit)
+    return suppliers, next_page_headers(next_cursor, limit)
+
+
+def next_page_headers(next_cursor, limit):
+    """Returns the X-Next-Cursor and Link headers of the next page, if there is one"""
+    if next_cursor is None:
+        return {}
+    args = request.args.to_dict(flat=False)
+    args.update(cursor=next_cursor, limit=limit)
+    next_url = url_for("list_suppliers", _external=True, **args)
+    return {"X-Next-Cursor": str(next_cursor), "Link": '<{}>; rel="next"'.format(next_url)}
+
+
+def stream_suppliers(query, fields=None):
+    """Streams the Suppliers of a query as newline delimited JSON"""
+    app.logger.info("Streaming supplier list")
+    batch_size = app.config["STREAM_BATCH_SIZE"]
+
+    def generate():
+        for supplier in Supplier.stream(query, batch_size):
+            if fields is None:
+                yield json.dumps(supplier.serialize()) + "\n"
+            else:
+                yield json.dumps(Supplier.serialize_row(supplier, fields)) + "\n"
+
+    return Response(stream_with_context(generate()), status.HTTP_200_OK, mimetype=NDJSON)
+
+
+def sync_suppliers(since):
+    """Returns the Suppliers changed and deleted after a revision and the new revision
+
+    At most limit changes are returned, so a client syncs again from the new
+    revision until it gets fewer than that. Filters and fields would leave
+    changes out of the sync for good, so they are rejected
+    """
+    others = sorted(set(request.args) - {"since", "limit"})
+    if others:
+        app.logger.error("Sync with other query parameters: %s", others)
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            "Query parameter 'since' cannot be used with: {}".format(", ".join(others)),
+        )
+    revision, suppliers, deleted = Supplier.changed_since(
+        since, app.config["SYNC_SETTLE_SECONDS"], get_page_size()
+    )
+    app.logger.info(
+        "Returning %d changed and %d deleted suppliers up to revision %s",
+        len(suppliers),
+        len(deleted),
+        revision,
+    )
+    message = {
+        "revision": revision,
+        "suppliers": [supplier.serialize() for supplier in suppliers],
+        "deleted": deleted,
+    }
+    return make_response(jsonify(message), status.HTTP_200_OK, {"X-Revision": str(revision)})
+
+
+######################################################################
+# COUNT THE SUPPLIERS
+######################################################################
+@app.route("/suppliers/stats", methods=["GET"])
+def get_supplier_stats():
+    """
+    Returns the number of Suppliers by category, availability and status
+
+    Takes the same filters as the supplier list
+    """
+    app.logger.info("Request for supplier stats")
+    stats = Supplier.stats(**get_filters())
+    return make_response(jsonify(stats), status.HTTP_200_OK)
 
-    results = [supplier.serialize() for supplier in suppliers]
-    app.logger.info("Returning %d suppliers", len(results))
-    return make_response(jsonify(results), status.HTTP_200_OK)
+
+######################################################################
+# STREAM THE CHANGES TO SUPPLIERS
+######################################################################
+@app.route("/suppliers/changes", methods=["GET"])
+def stream_supplier_changes():
+    """
+    Streams the changes to Suppliers as Server-Sent Events
+
+    Every event has the id of the change, the action as its type and the
+    Supplier as it is now as its data. The change log is polled, so every
+    worker sees the changes made by all of the others. A client that
+    reconnects with Last-Event-ID gets the changes it missed, or a reset
+    event when they are no longer in the change log. The stream ends after
+    CHANGE_FEED_TIMEOUT seconds and the client reconnects. Without
+    CHANGE_FEED_ENABLED the response is 204_NO_CONTENT, which tells the
+    client not to reconnect, and a worker that already has
+    CHANGE_FEED_MAX_STREAMS streams open answers 503_SERVICE_UNAVAILABLE
+    """
+    app.logger.info("Request for supplier changes")
+    if not app.config["CHANGE_FEED_ENABLED"]:
+        app.logger.info("The change feed is not enabled")
+        return make_response("", status.HTTP_204_NO_CONTENT)
+    last_id = get_last_event_id()
+    with open_streams_lock:
+        if open_streams["count"] >= app.config["CHANGE_FEED_MAX_STREAMS"]:
+            abort(
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                "Too many change streams are open, try again later",
+            )
+        open_streams["count"] += 1
+    poll_seconds = app.config["CHANGE_FEED_POLL_SECONDS"]
+    timeout = app.config["CHANGE_FEED_TIMEOUT"]
+    batch_size = app.config["CHANGE_FEED_BATCH_SIZE"]
+    settle_seconds = app.config["CHANGE_FEED_SETTLE_SECONDS"]
+    log_size = app.config["CHANGE_LOG_SIZE"]
+    trim_interval = app.config["CHANGE_LOG_TRIM_INTERVAL"]
+
+    stream = {"open": True}
+
+    def close_stream():
+        """Counts the stream as closed once, when it ends or its response is closed"""
+        with open_streams_lock:
+            if stream["open"]:
+                stream["open"] = False
+                open_streams["count"] -= 1
+
+    def generate():
+        try:
+            yield from poll_changes()
+        finally:
+            close_stream()
+
+    def poll_changes():
+        cursor = last_id
+        yield "retry: {}\n\n".format(int(poll_seconds * 1000))
+        first_id = SupplierChange.first_id()
+        if cursor is None or (first_id is not None and cursor < first_id - 1):
+            latest = SupplierChange.last_id()
+            if cursor is not None:
+                app.logger.info("Changes after %s are gone, resetting to %s", cursor, latest)
+                yield format_event(latest, "reset", {"id": latest})
+            cursor = latest
+        deadline = time.monotonic() + timeout
+        keep_alive = time.monotonic()
+        while True:
+            changes = SupplierChange.since(cursor, batch_size, settle_seconds)
+            SupplierChange.trim_if_due(log_size, trim_interval)
+            # the connection goes back to the pool while the stream waits
+            db.session.remove()
+            for change in changes:
+                cursor = change.id
+                yield format_event(change.id, change.action, serialize_change(change))
+            if len(changes) == batch_size:
+                continue
+            if time.monotonic() >= deadline:
+                return
+            if time.monotonic() - keep_alive >= 15:
+                keep_alive = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(poll_seconds)
+
+    response = Response(
+        stream_with_context(generate()),
+        status.HTTP_200_OK,
+        {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        mimetype=EVENT_STREAM,
+    )
+    # a response that is closed before it is read never runs the generator
+    response.call_on_close(close_stream)
+    return response
+
+
+def format_event(event_id, event_type, data):
+    """Returns a Server-Sent Event"""
+    return "id: {}\nevent: {}\ndata: {}\n\n".format(event_id, event_type, json.dumps(data))
+
+
+def serialize_change(change):
+    """Serializes the Supplier of a change, which only has an id once it is deleted"""
+    data = {"id": change.supplier_id}
+    if change.name is not None:
+        data.update(Supplier.serialize_row(change, Supplier.FIELDS))
+    return data
+
+
+######################################################################
+# UPDATE MANY SUPPLIERS
+######################################################################
+@app.route("/suppliers", methods=["PATCH"])
+def update_suppliers_bulk():
+    """
+    Update many Suppliers
+
+    This endpoint will apply the attributes in the body to every Supplier
+    matching the ids or filters in the query string with a single UPDATE
+    """
+    app.logger.info("Request to update suppliers in bulk")
+    check_content_type("application/json")
+    changes = Supplier.validate_changes(request.get_json())
+    count = Supplier.update_many(select_suppliers(), changes)
+
+    app.logger.info("Updated %d suppliers.", count)
+    return make_response(jsonify(count=count), status.HTTP_200_OK)
+
+
+######################################################################
+# DELETE MANY SUPPLIERS
+######################################################################
+@app.route("/suppliers", methods=["DELETE"])
+def delete_suppliers_bulk():
+    """
+    Delete many Suppliers
+
+    This endpoint will delete every Supplier matching the ids or filters in
+    the query string with a single DELETE
+    """
+    app.logger.info("Request to delete suppliers in bulk")
+    count = Supplier.delete_many(select_suppliers())
+
+    app.logger.info("Deleted %d suppliers.", count)
+    return make_response(jsonify(count=count), status.HTTP_200_OK)
 
 
 ######################################################################
@@ -81,15 +408,31 @@ def get_suppliers(supplier_id):
     """
     Retrieve a single Supplier
 
-    This endpoint will return a Supplier based on it's id
+    This endpoint will return a Supplier based on it's id. A fields parameter
+    limits the Supplier to a comma separated list of fields
     """
     app.logger.info("Request for supplier with id: %s", supplier_id)
-    supplier = Supplier.find(supplier_id)
+    fields = get_fields_arg()
+    if fields is None:
+        supplier = Supplier.find(supplier_id)
+    else:
+        query = Supplier.query.filter(Supplier.id == supplier_id)
+        supplier = Supplier.select_fields(fields, query).first()
     if not supplier:
         raise NotFound("Supplier with id '{}' was not found.".format(supplier_id))
+    etag = Supplier.make_etag(supplier, fields)
+    if request.if_none_match.contains_weak(etag):
+        app.logger.info("Supplier with id [%s] not modified", supplier_id)
+        return not_modified(etag)
 
-    app.logger.info("Returning supplier: %s", supplier.name)
-    return make_response(jsonify(supplier.serialize()), status.HTTP_200_OK)
+    app.logger.info("Returning supplier with id: %s", supplier_id)
+    if fields is None:
+        message = supplier.serialize()
+    else:
+        message = Supplier.serialize_row(supplier, fields)
+    response = make_response(jsonify(message), status.HTTP_200_OK)
+    response.set_etag(etag)
+    return response
 
 
 ######################################################################
@@ -103,16 +446,67 @@ def create_suppliers():
     """
     app.logger.info("Request to create a supplier")
     check_content_type("application/json")
+    data = request.get_json()
+    idempotency_key = get_idempotency_key(data)
+    if idempotency_key is not None and idempotency_key.response:
+        return replay_created(idempotency_key)
+
     supplier = Supplier()
-    supplier.deserialize(request.get_json())
-    supplier.create()
+    supplier.deserialize(data)
+    try:
+        supplier.create(idempotency_key)
+    except IntegrityError:
+        # a concurrent request with the same key may have created the Supplier first
+        stored = get_idempotency_key(data) if idempotency_key is not None else None
+        if stored is None or not stored.response:
+            raise
+        return replay_created(stored)
+    app.logger.info("Supplier with ID [%s] created.", supplier.id)
+    if idempotency_key is not None:
+        IdempotencyKey.sweep_if_due(
+            app.config["IDEMPOTENCY_KEY_TTL"], app.config["IDEMPOTENCY_SWEEP_INTERVAL"]
+        )
+        # the stored response, so the retries get exactly the same bytes
+        return stored_created(idempotency_key)
+
     message = supplier.serialize()
     location_url = url_for("get_suppliers", supplier_id=supplier.id, _external=True)
-
-    app.logger.info("Supplier with ID [%s] created.", supplier.id)
-    return make_response(
+    response = make_response(
         jsonify(message), status.HTTP_201_CREATED, {"Location": location_url}
     )
+    response.set_etag(supplier.etag)
+    return response
+
+
+######################################################################
+# ADD MANY NEW SUPPLIERS
+######################################################################
+@app.route("/suppliers/bulk", methods=["POST"])
+def create_suppliers_bulk():
+    """
+    Creates many Suppliers
+
+    This endpoint will create all of the valid Suppliers in the body that is
+    posted, either as a JSON array or as newline delimited JSON, in a single
+    transaction. The ids of the new Suppliers are returned in the order they
+    were posted, along with the index and message of every item that failed
+    validation
+    """
+    app.logger.info("Request to create suppliers in bulk")
+    check_content_type("application/json", NDJSON)
+    items = get_bulk_items()
+    suppliers = []
+    errors = []
+    for index, data in enumerate(items):
+        try:
+            suppliers.append(Supplier().deserialize(data))
+        except DataValidationError as error:
+            errors.append({"index": index, "message": str(error)})
+
+    ids = Supplier.create_many(suppliers) if suppliers else []
+    app.logger.info("Created %d suppliers, rejected %d", len(ids), len(errors))
+    return_code = status.HTTP_201_CREATED if ids else status.HTTP_400_BAD_REQUEST
+    return make_response(jsonify(ids=ids, errors=errors), return_code)
 
 
 ######################################################################
@@ -130,12 +524,40 @@ def update_suppliers(supplier_id):
     supplier = Supplier.find(supplier_id)
     if not supplier: 
         raise NotFound("Supplier with id '{}' was not found.".format(supplier_id))
-    supplier.deserialize(request.get_json())
+    check_if_match(supplier)
+    data = request.get_json()
+    supplier.deserialize(data)
     supplier.id = supplier_id
-    supplier.update()
+    try:
+        supplier.update()
+    except StaleDataError:
+        # the copy from the cache was stale, so check and change the current row
+        supplier = Supplier.find_or_404(supplier_id)
+        check_if_match(supplier)
+        supplier.deserialize(data)
+        supplier.update()
 
     app.logger.info("Supplier with ID [%s] updated.", supplier.id)
-    return make_response(jsonify(supplier.serialize()), status.HTTP_200_OK)
+    response = make_response(jsonify(supplier.serialize()), status.HTTP_200_OK)
+    response.set_etag(supplier.etag)
+    return response
+
+
+######################################################################
+# PATCH AN EXISTING SUPPLIER
+######################################################################
+@app.route("/suppliers/<int:supplier_id>", methods=["PATCH"])
+def patch_suppliers(supplier_id):
+    """
+    Partially update a Supplier
+
+    This endpoint will change only the fields in the body with a single
+    UPDATE and return the updated Supplier without loading it first
+    """
+    app.logger.info("Request to patch supplier with id: %s", supplier_id)
+    check_content_type("application/json")
+    changes = Supplier.validate_changes(request.get_json())
+    return apply_changes(supplier_id, changes)
 
 
 ######################################################################
@@ -147,11 +569,15 @@ def delete_suppliers(supplier_id):
     Delete a Supplier
 
     This endpoint will delete a Supplier based the id specified in the path
+    with a single DELETE, and honors If-Match when it is given
     """
     app.logger.info("Request to delete supplier with id: %s", supplier_id)
-    supplier = Supplier.find(supplier_id)
-    if supplier:
-        supplier.delete()
+    versions = get_if_match_versions(supplier_id)
+    count = Supplier.delete_by_id(supplier_id, versions)
+    if not count and versions is not None:
+        # a missing Supplier is already deleted, a changed one is a conflict
+        if Supplier.find(supplier_id):
+            check_exists_or_412(supplier_id)
 
     app.logger.info("Supplier with ID [%s] delete complete.", supplier_id)
     return make_response("", status.HTTP_204_NO_CONTENT)
@@ -162,17 +588,271 @@ def delete_suppliers(supplier_id):
 ######################################################################
 
 
-def check_content_type(media_type):
+def check_content_type(*media_types):
     """Checks that the media type is correct"""
     content_type = request.headers.get("Content-Type")
-    if content_type and content_type == media_type:
+    if content_type and content_type in media_types:
         return
     app.logger.error("Invalid Content-Type: %s", content_type)
     abort(
         status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-        "Content-Type must be {}".format(media_type),
+        "Content-Type must be {}".format(" or ".join(media_types)),
+    )
+
+
+def get_bulk_items():
+    """Returns the items of a JSON array or NDJSON request body"""
+    if request.headers.get("Content-Type") == NDJSON:
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)  # reported as a bad item by deserialize
+    else:
+        items = request.get_json()
+        if not isinstance(items, list):
+            abort(status.HTTP_400_BAD_REQUEST, "Request body must be a JSON array")
+    if not items:
+        abort(status.HTTP_400_BAD_REQUEST, "Request body contains no suppliers")
+    if len(items) > app.config["BULK_MAX_ITEMS"]:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            "Request body may contain at most {} suppliers".format(
+                app.config["BULK_MAX_ITEMS"]
+            ),
+        )
+    return items
+
+
+def get_idempotency_key(data):
+    """Returns the stored or a new IdempotencyKey for the Idempotency-Key header
+
+    Returns None when there is no header, and aborts with 422 when the key
+    was already used for a request with a different body
+    """
+    key = request.headers.get("Idempotency-Key")
+    if key is None:
+        return None
+    if not key or len(key) > IdempotencyKey.MAX_LENGTH:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            "Idempotency-Key must have 1 to {} characters".format(IdempotencyKey.MAX_LENGTH),
+        )
+    request_hash = IdempotencyKey.hash_request(data)
+    idempotency_key = IdempotencyKey.find(key)
+    if idempotency_key is None:
+        return IdempotencyKey(key=key, request_hash=request_hash)
+    if idempotency_key.request_hash != request_hash:
+        abort(
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            "Idempotency-Key '{}' was used for a different request".format(key),
+        )
+    return idempotency_key
+
+
+def replay_created(idempotency_key):
+    """Returns the stored 201_CREATED response of an IdempotencyKey to a retry"""
+    app.logger.info("Replaying the creation of supplier [%s]", idempotency_key.supplier_id)
+    response = stored_created(idempotency_key)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def stored_created(idempotency_key):
+    """Returns the 201_CREATED response with the body stored with an IdempotencyKey"""
+    location_url = url_for(
+        "get_suppliers", supplier_id=idempotency_key.supplier_id, _external=True
+    )
+    response = app.response_class(
+        idempotency_key.response,
+        status=status.HTTP_201_CREATED,
+        headers={"Location": location_url},
+        content_type=idempotency_key.content_type,
+    )
+    response.set_etag(idempotency_key.etag)
+    return response
+
+
+def not_modified(etag, headers=None):
+    """Returns an empty 304_NOT_MODIFIED response for an ETag"""
+    response = make_response("", status.HTTP_304_NOT_MODIFIED, headers or {})
+    response.set_etag(etag)
+    return response
+
+
+def check_if_match(supplier):
+    """Checks that the If-Match header matches the ETag of a Supplier"""
+    if not request.if_match or request.if_match.contains(supplier.etag):
+        return
+    # the Supplier may have come from the cache, so check the database too
+    supplier.refresh()
+    if request.if_match.contains(supplier.etag):
+        return
+    app.logger.error("ETag of supplier %s does not match If-Match", supplier.id)
+    abort(
+        status.HTTP_412_PRECONDITION_FAILED,
+        "Supplier with id '{}' has been changed.".format(supplier.id),
     )
 
+
+def apply_changes(supplier_id, changes):
+    """Changes a Supplier that matches If-Match with one UPDATE and returns it"""
+    row = Supplier.update_by_id(supplier_id, changes, get_if_match_versions(supplier_id))
+    if row is None:
+        check_exists_or_412(supplier_id)
+
+    app.logger.info("Supplier with ID [%s] changed.", supplier_id)
+    fields = Supplier.fieldset(Supplier.FIELDS)
+    response = make_response(jsonify(Supplier.serialize_row(row, fields)), status.HTTP_200_OK)
+    response.set_etag(Supplier.make_etag(row))
+    return response
+
+
+def get_if_match_versions(supplier_id):
+    """Returns the versions of a Supplier in the If-Match header, or None for any version"""
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    prefix = "{}-".format(supplier_id)
+    versions = []
+    for etag in request.if_match.as_set():
+        version = etag[len(prefix):]
+        if etag.startswith(prefix) and version.isdigit():
+            versions.append(int(version))
+    return versions
+
+
+def check_exists_or_412(supplier_id):
+    """Aborts with 404 if a Supplier does not exist, or 412 if it did not match If-Match"""
+    if not Supplier.find(supplier_id):
+        raise NotFound("Supplier with id '{}' was not found.".format(supplier_id))
+    app.logger.error("ETag of supplier %s does not match If-Match", supplier_id)
+    abort(
+        status.HTTP_412_PRECONDITION_FAILED,
+        "Supplier with id '{}' has been changed.".format(supplier_id),
+    )
+
+
+def get_filters():
+    """Returns the filters in the query string that were given"""
+    filters = {
+        "category": request.args.get("category") or None,
+        "name": request.args.get("name") or None,
+        "available": get_bool_arg("availability"),
+        "status": request.args.get("status") or None,
+    }
+    return {name: value for name, value in filters.items() if value is not None}
+
+
+def filter_suppliers():
+    """Returns a query for the filters in the query string, or None if there are none"""
+    filters = get_filters()
+    if not filters:
+        return None
+    return Supplier.find_by_filters(**filters)
+
+
+def select_suppliers():
+    """Returns a query for the ids and filters in the query string of a bulk request"""
+    ids = request.args.getlist("id")
+    if not all(supplier_id.isdigit() for supplier_id in ids):
+        abort(status.HTTP_400_BAD_REQUEST, "Query parameter 'id' must be an integer")
+    query = filter_suppliers()
+    if ids:
+        if query is None:
+            query = Supplier.query
+        query = query.filter(Supplier.id.in_([int(supplier_id) for supplier_id in ids]))
+    if query is None:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            "Bulk requests must select suppliers by id or by a filter",
+        )
+    return query
+
+
+def use_fast_serialization():
+    """Returns True if lists should be encoded straight from rows of columns"""
+    if not app.config["FAST_LIST_SERIALIZATION"]:
+        return False
+    # pretty printed output is left to jsonify()
+    return not (app.config["JSONIFY_PRETTYPRINT_REGULAR"] or app.debug)
+
+
+def get_fields_arg():
+    """Returns the sparse fieldset in the query string, or None if it was not given"""
+    value = request.args.get("fields")
+    if not value:
+        return None
+    return Supplier.fieldset([name.strip() for name in value.split(",")])
+
+
+def get_bool_arg(name):
+    """Returns a boolean query parameter, or None if it was not given"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    if value.lower() in ("true", "t", "yes", "1"):
+        return True
+    if value.lower() in ("false", "f", "no", "0"):
+        return False
+    app.logger.error("Invalid query parameter %s: %s", name, value)
+    abort(
+        status.HTTP_400_BAD_REQUEST,
+        "Query parameter '{}' must be true or false".format(name),
+    )
+    return None
+
+
+def get_last_event_id():
+    """Returns the Last-Event-ID header or last_event_id argument as an int, or None"""
+    value = request.headers.get("Last-Event-ID", request.args.get("last_event_id"))
+    if value is None or value == "":
+        return None
+    if not value.isdigit():
+        abort(status.HTTP_400_BAD_REQUEST, "Last-Event-ID must be a change id")
+    return int(value)
+
+
+def get_search_cursor():
+    """Returns the rank, distance and id in the cursor of a page of search results"""
+    cursor = request.args.get("cursor")
+    if cursor is None:
+        return None
+    parts = cursor.split("-")
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        app.logger.error("Invalid search cursor: %s", cursor)
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            "Query parameter 'cursor' must be a rank, a distance and an id like 1-4-42",
+        )
+    return tuple(int(part) for part in parts)
+
+
+def get_page_size():
+    """Returns the limit in the query string, or the default, up to MAX_PAGE_SIZE"""
+    limit = get_int_arg("limit", minimum=1) or app.config["DEFAULT_PAGE_SIZE"]
+    return min(limit, app.config["MAX_PAGE_SIZE"])
+
+
+def get_int_arg(name, minimum=0):
+    """Returns an integer query parameter, or None if it was not given"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or number < minimum:
+        app.logger.error("Invalid query parameter %s: %s", name, value)
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            "Query parameter '{}' must be an integer >= {}".format(name, minimum),
+        )
+    return number
+
 ######################################################################
 #  A C T I O N   E N D P O I N T  F U N C T I O N 
 ######################################################################
@@ -181,16 +861,46 @@ def disable_suppliers(supplier_id):
     """
     Update Supplier status to disabled
 
-    This endpoint will update a Supplier based the body that is posted
+    This endpoint will disable a Supplier with a single UPDATE, any body is ignored
     """
     app.logger.info("Request to disable supplier with id: %s", supplier_id)
-    check_content_type("application/json")
-    supplier = Supplier.find(supplier_id)
-    if not supplier: 
-        raise NotFound("Supplier with id '{}' was not found.".format(supplier_id))
-    supplier.deserialize(request.get_json())
-    supplier.status = "disabled"
-    supplier.update()
+    return apply_changes(supplier_id, {"status": "disabled"})
+
 
-    app.logger.info("Supplier with ID [%s] disabled.", supplier.id)
-    return make_response(jsonify(supplier.serialize()), status.HTTP_200_OK)
\ No newline at end of file
+@app.route("/suppliers/<int:supplier_id>/enable", methods=["PUT"])
+def enable_suppliers(supplier_id):
+    """
+    Update Supplier status to enabled
+
+    This endpoint will enable a Supplier with a single UPDATE, any body is ignored
+    """
+    app.logger.info("Request to enable supplier with id: %s", supplier_id)
+    return apply_changes(supplier_id, {"status": "enabled"})
+
+
+@app.route("/suppliers/disable", methods=["PUT"])
+def disable_suppliers_bulk():
+    """
+    Disable many Suppliers
+
+    This endpoint will disable every Supplier matching the ids or filters in
+    the query string with a single UPDATE
+    """
+    app.logger.info("Request to disable suppliers in bulk")
+    count = Supplier.update_many(select_suppliers(), {"status": "disabled"})
+    app.logger.info("Disabled %d suppliers.", count)
+    return make_response(jsonify(count=count), status.HTTP_200_OK)
+
+
+@app.route("/suppliers/enable", methods=["PUT"])
+def enable_suppliers_bulk():
+    """
+    Enable many Suppliers
+
+    This endpoint will enable every Supplier matching the ids or filters in
+    the query string with a single UPDATE
+    """
+    app.logger.info("Request to enable suppliers in bulk")
+    count = Supplier.update_many(select_suppliers(), {"status": "enabled"})
+    app.logger.info("Enabled %d suppliers.", count)
+    return make_response(jsonify(count=count), status.HTTP_200_OK)
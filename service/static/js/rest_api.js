@@ -249,13 +249,14 @@ $(function () {
             let firstsupplier = "";
             for(let i = 0; i < res.length; i++) {
                 let supplier = res[i];
-                table +=  `<tr id="row_${i}"><td>${supplier.id}</td><td>${supplier.name}</td><td>${supplier.category}</td><td>${supplier.available}</td><td>${supplier.status}</td>`;
+                table +=  `<tr id="row_${i}" data-id="${supplier.id}"><td>${supplier.id}</td><td>${supplier.name}</td><td>${supplier.category}</td><td>${supplier.available}</td><td>${supplier.status}</td>`;
                 if (i == 0) {
                     firstsupplier = supplier;
                 }
             }
             table += '</tbody></table>';
             $("#search_results").append(table);
+            watch_search_results();
 
             // copy the first result to the form
             if (firstsupplier != "") {
@@ -271,4 +272,45 @@ $(function () {
 
     });
 
-})
\ No newline at end of file
+    // ****************************************
+    // Keep the search results up to date
+    // ****************************************
+
+    function update_search_result(event) {
+        let supplier = JSON.parse(event.data);
+        let row = $(`#search_results tr[data-id="${supplier.id}"]`);
+        if (row.length == 0) {
+            return;
+        }
+        if (event.type == "delete") {
+            row.remove();
+            return;
+        }
+        let cells = row.children("td");
+        cells.eq(1).text(supplier.name);
+        cells.eq(2).text(supplier.category);
+        cells.eq(3).text(supplier.available);
+        cells.eq(4).text(supplier.status);
+    }
+
+    // A stream holds a thread of a worker, so it is only open while there
+    // are search results on a visible page. The service answers 204 or 503
+    // when it cannot hold a stream open, and EventSource gives up after that
+    let changes = null;
+
+    function watch_search_results() {
+        let wanted = $("#search_results tr[data-id]").length > 0 && !document.hidden;
+        if (wanted && changes == null && window.EventSource) {
+            changes = new EventSource("/suppliers/changes");
+            for (let action of ["update", "disable", "enable", "delete"]) {
+                changes.addEventListener(action, update_search_result);
+            }
+        } else if (!wanted && changes != null) {
+            changes.close();
+            changes = null;
+        }
+    }
+
+    document.addEventListener("visibilitychange", watch_search_results);
+
+})
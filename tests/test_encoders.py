@@ -0,0 +1,78 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Test cases for the fast JSON encoders
+
+Test cases can be run with:
+    nosetests
+    coverage report -m
+"""
+import unittest
+from unittest.mock import patch
+from flask import jsonify
+from service import app, encoders
+from service.encoders import RowEncoder
+from service.models import Supplier
+from .factories import SupplierFactory
+
+FIELDS = ("id", "name", "category", "available", "status")
+
+
+######################################################################
+#  R O W   E N C O D E R   T E S T   C A S E S
+######################################################################
+class TestRowEncoder(unittest.TestCase):
+    """Test Cases for the Row Encoder"""
+
+    def setUp(self):
+        """Runs before each test"""
+        self.suppliers = SupplierFactory.build_batch(3)
+        self.suppliers[0].name = 'Café "Dupont" \\ \n\t  \U0001F600'
+        self.suppliers[1].name = "\x00\x1f\x7f</script>"
+        self.rows = [
+            tuple(getattr(supplier, name) for name in FIELDS) for supplier in self.suppliers
+        ]
+
+    def _jsonify(self, **config):
+        """Returns the bytes jsonify() sends for the serialized Suppliers"""
+        with patch.dict(app.config, config), app.test_request_context():
+            return jsonify([supplier.serialize() for supplier in self.suppliers]).data
+
+    def test_matches_jsonify(self):
+        """Encode rows exactly like jsonify() encodes serialize()"""
+        for ensure_ascii in (True, False):
+            encoder = RowEncoder(FIELDS, ensure_ascii=ensure_ascii)
+            self.assertEqual(
+                encoder.encode(self.rows), self._jsonify(JSON_AS_ASCII=ensure_ascii)
+            )
+
+    def test_matches_jsonify_without_orjson(self):
+        """Encode rows exactly like jsonify() with the standard library"""
+        with patch.object(encoders, "orjson", None):
+            encoder = RowEncoder(FIELDS, ensure_ascii=False)
+        self.assertEqual(encoder.encode(self.rows), self._jsonify(JSON_AS_ASCII=False))
+
+    def test_matches_serialize_row(self):
+        """Encode selected columns like serialize_row()"""
+        fields = ("id", "name")
+        rows = [(supplier.id, supplier.name) for supplier in self.suppliers]
+        with app.test_request_context():
+            expected = jsonify([Supplier.serialize_row(s, fields) for s in self.suppliers]).data
+        encoder = RowEncoder(fields, ensure_ascii=app.config["JSON_AS_ASCII"])
+        self.assertEqual(encoder.encode(rows), expected)
+
+    def test_encode_empty_list(self):
+        """Encode no rows"""
+        self.assertEqual(RowEncoder(FIELDS).encode([]), b"[]\n")
@@ -0,0 +1,106 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Test cases for the queued logging handlers
+
+Test cases can be run with:
+    nosetests
+    coverage report -m
+"""
+import sys
+import json
+import queue
+import logging
+import unittest
+from service.log_handlers import (
+    PreparedQueueHandler,
+    SamplingFilter,
+    JsonFormatter,
+    install_queue_logging,
+)
+
+
+class ListHandler(logging.Handler):
+    """Keeps the formatted records"""
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def make_record(name="test", msg="Processing lookup for id %s ...", args=(1,), level=20):
+    """Returns a log record"""
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+######################################################################
+#  L O G   H A N D L E R S   T E S T   C A S E S
+######################################################################
+class TestLogHandlers(unittest.TestCase):
+    """Test Cases for the Log Handlers"""
+
+    def test_prepare_merges_args(self):
+        """Merge the arguments into the message before it is queued"""
+        log_queue = queue.SimpleQueue()
+        handler = PreparedQueueHandler(log_queue)
+        args = [1]
+        handler.handle(make_record(args=(args,)))
+        args.append(2)
+        record = log_queue.get_nowait()
+        self.assertEqual(record.msg, "Processing lookup for id [1] ...")
+        self.assertIsNone(record.args)
+        self.assertFalse(hasattr(record, "message"))
+
+    def test_sampling_filter(self):
+        """Keep one in every N records of each logger"""
+        sampler = SamplingFilter({"Processing lookup for id": 10})
+        kept = [sampler.filter(make_record()) for _ in range(25)]
+        self.assertEqual(kept.count(True), 3)
+        self.assertTrue(kept[0])
+        self.assertTrue(sampler.filter(make_record(name="other")))
+        self.assertTrue(sampler.filter(make_record(msg="Processing all Suppliers", args=())))
+        self.assertTrue(sampler.filter(make_record(level=logging.WARNING)))
+
+    def test_json_formatter(self):
+        """Format records as one line of JSON"""
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = make_record(msg="Failed %s", args=("x",), level=logging.ERROR)
+            record.exc_info = sys.exc_info()
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["message"], "Failed x")
+        self.assertEqual(entry["level"], "ERROR")
+        self.assertEqual(entry["logger"], "test")
+        self.assertIn("ValueError: boom", entry["exception"])
+
+    def test_install_queue_logging(self):
+        """Write the records of the loggers from the listener thread"""
+        logger = logging.getLogger("test.queued")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = ListHandler()
+        listener = install_queue_logging([logger], [handler], {"Processing lookup": 2})
+        for supplier_id in range(4):
+            logger.info("Processing lookup for id %s ...", supplier_id)
+        logger.info("Done")
+        listener.stop()
+        self.assertEqual(
+            handler.lines,
+            ["Processing lookup for id 0 ...", "Processing lookup for id 2 ...", "Done"],
+        )
@@ -0,0 +1,143 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Test cases for the metrics registry
+
+Test cases can be run with:
+    nosetests
+    coverage report -m
+"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from service.metrics import MetricsRegistry, Counter, Gauge, Histogram
+
+
+######################################################################
+#  M E T R I C S   R E G I S T R Y   T E S T   C A S E S
+######################################################################
+class TestMetricsRegistry(unittest.TestCase):
+    """Test Cases for the Metrics Registry"""
+
+    def setUp(self):
+        """Runs before each test"""
+        self.registry = MetricsRegistry()
+        self.requests = self.registry.register(
+            Counter("requests_total", "Requests", ("endpoint",))
+        )
+        self.latency = self.registry.register(
+            Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        )
+        self.in_use = self.registry.register(Gauge("in_use", "In use"))
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test"""
+        shutil.rmtree(self.directory)
+
+    def test_render(self):
+        """Render counters, gauges and histograms"""
+        self.requests.inc(endpoint="index")
+        self.requests.inc(2, endpoint="index")
+        self.requests.inc(endpoint='say "hi"')
+        self.in_use.set(3)
+        self.latency.observe(0.05)
+        self.latency.observe(0.5)
+        self.latency.observe(5)
+        text = self.registry.render()
+        self.assertIn("# TYPE requests_total counter", text)
+        self.assertIn('requests_total{endpoint="index"} 3', text)
+        self.assertIn('requests_total{endpoint="say \\"hi\\""} 1', text)
+        self.assertIn("in_use 3", text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn("latency_seconds_sum 5.55", text)
+        self.assertIn("latency_seconds_count 3", text)
+
+    def test_collectors(self):
+        """Update metrics from collectors before they are read"""
+        self.registry.add_collector(lambda: self.in_use.set(7))
+        self.assertIn("in_use 7", self.registry.render())
+
+    def test_multiprocess(self):
+        """Add up the metrics that the workers write to a shared directory"""
+        self.registry.configure(self.directory)
+        self.requests.inc(endpoint="index")
+        self.latency.observe(0.5)
+        self.in_use.set(2)
+        # a worker that has exited, and one that is still running
+        for pid in (2 ** 22 + 1, os.getppid()):
+            snapshot = {
+                "pid": pid,
+                "metrics": {
+                    "requests_total": dict(
+                        self.requests.snapshot(), samples=[[["index"], 4]]
+                    ),
+                    "latency_seconds": dict(
+                        self.latency.snapshot(), samples=[[[], [1, 0, 0, 0.05]]]
+                    ),
+                    "in_use": dict(self.in_use.snapshot(), samples=[[[], 5]]),
+                },
+            }
+            path = os.path.join(self.directory, "metrics_{}.json".format(pid))
+            with open(path, "w") as snapshot_file:
+                json.dump(snapshot, snapshot_file)
+        text = self.registry.render()
+        self.assertIn('requests_total{endpoint="index"} 9', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 2', text)
+        self.assertIn("latency_seconds_count 3", text)
+        # gauges of workers that have exited are left out
+        self.assertIn("in_use 7", text)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory, "metrics_{}.json".format(os.getpid())))
+        )
+        # the counters of the worker that exited are kept in the retired metrics
+        self.assertFalse(
+            os.path.exists(os.path.join(self.directory, "metrics_{}.json".format(2 ** 22 + 1)))
+        )
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "metrics_retired.json")))
+        text = self.registry.render()
+        self.assertIn('requests_total{endpoint="index"} 9', text)
+        self.assertIn("latency_seconds_count 3", text)
+        self.assertIn("in_use 7", text)
+
+    def test_reused_pid(self):
+        """Keep the counters of an exited worker whose pid is used again"""
+        self.requests.inc(endpoint="index")
+        snapshot = {
+            "pid": os.getpid(),
+            "metrics": {"requests_total": dict(self.requests.snapshot(), samples=[[["index"], 4]])},
+        }
+        path = os.path.join(self.directory, "metrics_{}.json".format(os.getpid()))
+        with open(path, "w") as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        self.registry.configure(self.directory)
+        self.assertIn('requests_total{endpoint="index"} 5', self.registry.render())
+        self.assertIn('requests_total{endpoint="index"} 5', self.registry.render())
+
+    def test_flush_interval(self):
+        """Write the metrics of a worker at most once per interval"""
+        self.registry.configure(self.directory, flush_interval=60)
+        path = os.path.join(self.directory, "metrics_{}.json".format(os.getpid()))
+        self.registry.flush()
+        self.assertTrue(os.path.exists(path))
+        os.remove(path)
+        self.registry.flush()
+        self.assertFalse(os.path.exists(path))
+        self.registry.flush(force=True)
+        self.assertTrue(os.path.exists(path))
@@ -0,0 +1,130 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Test cases for reading from database replicas
+
+Two SQLite files stand in for the replicas of a third one, the primary.
+Nothing is replicated between them, so every response shows which of the
+databases it was read from.
+
+Test cases can be run with:
+    nosetests
+    coverage report -m
+"""
+import os
+import time
+import logging
+import tempfile
+import unittest
+from service import app, status
+from service.models import Supplier, db, init_db, supplier_cache, stats_cache
+from service.replicas import init_replicas, replica_binds, WRITE_COOKIE
+
+BASE_URL = "/suppliers"
+
+
+######################################################################
+#  R E P L I C A   T E S T   C A S E S
+######################################################################
+class TestReadReplicas(unittest.TestCase):
+    """Test Cases for routing the reads to replicas"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Uses a SQLite file as the primary and two more as its replicas"""
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.uris = [
+            "sqlite:///" + os.path.join(cls.directory.name, name + ".db")
+            for name in ("primary", "replica_0", "replica_1")
+        ]
+        cls.database_uri = app.config["SQLALCHEMY_DATABASE_URI"]
+        app.config["TESTING"] = True
+        app.config["SQLALCHEMY_DATABASE_URI"] = cls.uris[0]
+        app.config["DATABASE_REPLICA_URIS"] = cls.uris[1:]
+        app.logger.setLevel(logging.CRITICAL)
+        init_replicas(app)
+        init_db(app)
+        cls.context = app.app_context()
+        cls.context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Goes back to the test database without replicas"""
+        db.session.remove()
+        db.drop_all(bind="__all__")
+        cls.context.pop()
+        app.config["SQLALCHEMY_DATABASE_URI"] = cls.database_uri
+        app.config["DATABASE_REPLICA_URIS"] = []
+        init_replicas(app)
+        cls.directory.cleanup()
+
+    def setUp(self):
+        """Creates the tables in every database and one Supplier in each replica"""
+        db.session.remove()
+        supplier_cache.clear()
+        stats_cache.clear()
+        db.create_all()
+        for bind in replica_binds:
+            engine = db.get_engine(app, bind=bind)
+            db.Model.metadata.create_all(engine)
+            with engine.begin() as connection:
+                connection.execute(
+                    Supplier.__table__.insert().values(
+                        id=1, name=bind, category="c", available=True, status="enabled"
+                    )
+                )
+        self.app = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        for bind in replica_binds:
+            db.Model.metadata.drop_all(db.get_engine(app, bind=bind))
+
+    def get_names(self):
+        """Returns the names of the Suppliers of the next list request"""
+        db.session.remove()
+        resp = self.app.get(BASE_URL)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return [supplier["name"] for supplier in resp.get_json()]
+
+    def test_reads_use_replicas_in_turn(self):
+        """Read from the replicas in turn"""
+        names = [self.get_names() for _ in range(4)]
+        self.assertEqual(sorted(names[:2]), [["replica_0"], ["replica_1"]])
+        self.assertEqual(names[2:], names[:2])
+
+    def test_read_your_writes(self):
+        """Read from the primary for a while after a write"""
+        data = {"name": "primary", "category": "c", "available": True, "status": "enabled"}
+        resp = self.app.post(BASE_URL, json=data)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertIn(WRITE_COOKIE, resp.headers["Set-Cookie"])
+        self.assertEqual(self.get_names(), ["primary"])
+        self.assertEqual(self.get_names(), ["primary"])
+        # the window has passed
+        self.app.set_cookie("localhost", WRITE_COOKIE, str(time.time() - 1))
+        self.assertIn(self.get_names()[0], replica_binds)
+
+    def test_replica_reads_are_not_cached(self):
+        """Keep the rows read from a replica out of the cache"""
+        resp = self.app.get(BASE_URL + "/1")
+        self.assertIn(resp.get_json()["name"], replica_binds)
+        self.assertEqual(len(supplier_cache), 0)
+        resp = self.app.get(BASE_URL + "/stats")
+        self.assertEqual(resp.get_json()["total"], 1)
+        self.assertEqual(len(stats_cache), 0)
+        resp = self.app.put(BASE_URL + "/1/disable")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
@@ -25,14 +25,22 @@ Test cases can be run with the following:
 """
 
 import os
+import json
 import logging
 import unittest
 
 # from unittest.mock import MagicMock, patch
+from unittest.mock import patch
 from urllib.parse import quote_plus
+from sqlalchemy import text as text_clause
+from sqlalchemy.exc import DBAPIError
 from service import app, status
-from service.models import db, init_db
+from service.models import db, init_db, supplier_cache, stats_cache, write_batcher
+from service.models import _supports_returning
+from service.models import Supplier, SupplierChange
+from service.batching import WriteQueueFull
 from .factories import SupplierFactory
+from .utils import assert_max_queries
 
 # Disable all but critical errors during normal test run
 # uncomment for debugging failing tests
@@ -62,16 +70,21 @@ class TestSupplierServer(unittest.TestCase):
         app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
         app.logger.setLevel(logging.CRITICAL)
         init_db(app)
+        cls.context = app.app_context()
+        cls.context.push()
 
     @classmethod
     def tearDownClass(cls):
         """Run once after all tests"""
         db.session.close()
+        cls.context.pop()
 
     def setUp(self):
         """Runs before each test"""
         db.drop_all()  # clean up the last tests
         db.create_all()  # create new tables
+        supplier_cache.clear()
+        stats_cache.clear()
         self.app = app.test_client()
 
     def tearDown(self):
@@ -101,6 +114,98 @@ class TestSupplierServer(unittest.TestCase):
        # data = resp.get_json()
        # self.assertEqual(data["name"], "Supplier REST API Service")
 
+    def test_metrics(self):
+        """Get the database pool metrics"""
+        self._create_suppliers(1)
+        resp = self.app.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.mimetype, "text/plain")
+        text = resp.get_data(as_text=True)
+        self.assertIn("# TYPE db_pool_checkouts_total counter", text)
+        self.assertIn("db_pool_checkout_wait_seconds_total ", text)
+
+    def test_metrics_per_route(self):
+        """Count and time the requests of each route"""
+        self._create_suppliers(1)
+        self.app.get(BASE_URL)
+        self.app.get("{}/0".format(BASE_URL))
+        text = self.app.get("/metrics").get_data(as_text=True)
+        self.assertIn(
+            'http_requests_total{endpoint="list_suppliers",method="GET",status="200"}', text
+        )
+        self.assertIn(
+            'http_requests_total{endpoint="get_suppliers",method="GET",status="404"}', text
+        )
+        self.assertIn(
+            'http_request_duration_seconds_bucket{endpoint="list_suppliers",'
+            'method="GET",le="+Inf"}',
+            text,
+        )
+        self.assertIn(
+            'http_request_db_seconds_count{endpoint="create_suppliers",method="POST"}', text
+        )
+        self.assertIn("# TYPE supplier_cache_hits_total counter", text)
+        self.assertIn('service_startup_seconds{phase="import"}', text)
+
+    def test_db_debug_headers(self):
+        """Send the query count and database time of a request as headers"""
+        supplier = self._create_suppliers(1)[0]
+        resp = self.app.get("{}/{}".format(BASE_URL, supplier.id))
+        self.assertNotIn("X-DB-Queries", resp.headers)
+        with patch.dict(app.config, DB_DEBUG_HEADERS=True):
+            resp = self.app.get(BASE_URL)
+        self.assertEqual(resp.headers["X-DB-Queries"], "1")
+        self.assertGreater(float(resp.headers["X-DB-Time"]), 0)
+
+    def test_slow_query_log(self):
+        """Log the SQL and parameters of slow queries"""
+        with patch("service.models.query_timer.slow_seconds", 0):
+            with self.assertLogs("flask.app", level="WARNING") as logs:
+                self.app.get(BASE_URL, query_string="category=foods")
+        self.assertIn("Slow query", logs.output[0])
+        self.assertIn("foods", logs.output[0])
+
+    def test_slow_query_log_after_error(self):
+        """Keep timing the statements of a connection after one failed"""
+        with patch("service.models.query_timer.slow_seconds", 0):
+            with db.engine.connect() as connection:
+                for _ in range(3):
+                    self.assertRaises(
+                        DBAPIError, connection.execute, text_clause("SELECT * FROM no_such_table")
+                    )
+                with self.assertLogs("flask.app", level="WARNING") as logs:
+                    connection.execute(text_clause("SELECT 42"))
+                self.assertNotIn("query_start", connection.info)
+        self.assertIn("SELECT 42", logs.output[0])
+
+    def test_query_counts(self):
+        """Keep the number of queries of each route from growing"""
+        # without RETURNING the rows are inserted one at a time and read back
+        returning = _supports_returning()
+        with assert_max_queries(self, 2):
+            supplier = self.app.post(BASE_URL, json=SupplierFactory().serialize()).get_json()
+        url = "{}/{}".format(BASE_URL, supplier["id"])
+        with assert_max_queries(self, 1 if returning else 3):
+            self.app.post(
+                "{}/bulk".format(BASE_URL), json=[SupplierFactory().serialize()] * 3
+            )
+        with assert_max_queries(self, 1):
+            resp = self.app.get(BASE_URL, query_string="category=foods&availability=true")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        with assert_max_queries(self, 1):
+            self.app.get(BASE_URL, query_string="limit=2")
+        with assert_max_queries(self, 1):
+            self.app.get(url)
+        supplier["category"] = "unknown"
+        with assert_max_queries(self, 3):
+            self.app.put(url, json=supplier)
+        with assert_max_queries(self, 1):
+            self.app.patch(BASE_URL, query_string="category=unknown", json={"status": "x"})
+        with assert_max_queries(self, 1):
+            self.app.delete(url)
+        with assert_max_queries(self, 1):
+            self.app.delete(BASE_URL, query_string="status=enabled")
+
     def test_get_supplier_list(self):
         """Get a list of Suppliers"""
         self._create_suppliers(5)
@@ -109,6 +214,98 @@ class TestSupplierServer(unittest.TestCase):
         data = resp.get_json()
         self.assertEqual(len(data), 5)
 
+    def test_get_supplier_list_paged(self):
+        """Get a list of Suppliers one page at a time"""
+        suppliers = self._create_suppliers(5)
+        resp = self.app.get(BASE_URL, query_string="limit=2")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        ids = [supplier["id"] for supplier in resp.get_json()]
+        self.assertEqual(len(ids), 2)
+        while "Link" in resp.headers:
+            next_cursor = resp.headers["X-Next-Cursor"]
+            self.assertIn("cursor={}".format(next_cursor), resp.headers["Link"])
+            resp = self.app.get(
+                BASE_URL, query_string="limit=2&cursor={}".format(next_cursor)
+            )
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            ids.extend(supplier["id"] for supplier in resp.get_json())
+        self.assertEqual(ids, sorted(supplier.id for supplier in suppliers))
+        self.assertNotIn("X-Next-Cursor", resp.headers)
+
+    def test_get_supplier_list_bad_page(self):
+        """Get a page of Suppliers with a bad limit or cursor"""
+        resp = self.app.get(BASE_URL, query_string="limit=0")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.get(BASE_URL, query_string="cursor=abc")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_suppliers(self):
+        """Search the Suppliers by name one page at a time"""
+        for name in ("Acme Widgets", "Acme", "Acmeless", "Zenith"):
+            self.app.post(BASE_URL, json=dict(SupplierFactory().serialize(), name=name))
+        resp = self.app.get(BASE_URL, query_string="q=acme&limit=2")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        names = [supplier["name"] for supplier in resp.get_json()]
+        self.assertEqual(names, ["Acme", "Acmeless"])
+        self.assertRegex(resp.headers["X-Next-Cursor"], r"^1-4-\d+$")
+        resp = self.app.get(
+            BASE_URL, query_string="q=acme&limit=2&cursor=" + resp.headers["X-Next-Cursor"]
+        )
+        self.assertEqual([supplier["name"] for supplier in resp.get_json()], ["Acme Widgets"])
+        self.assertNotIn("X-Next-Cursor", resp.headers)
+        resp = self.app.get(BASE_URL, query_string="q=acme&fields=name")
+        self.assertEqual(resp.get_json()[0], {"id": resp.get_json()[0]["id"], "name": "Acme"})
+        resp = self.app.get(BASE_URL, query_string="q=acme&cursor=12")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_supplier_stats(self):
+        """Count the Suppliers by category, availability and status"""
+        suppliers = self._create_suppliers(5)
+        resp = self.app.get("{}/stats".format(BASE_URL))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data["total"], 5)
+        self.assertEqual(sum(data["category"].values()), 5)
+        self.assertEqual(data["status"], {"enabled": 5})
+        category = suppliers[0].category
+        resp = self.app.get(
+            "{}/stats".format(BASE_URL),
+            query_string={"category": category, "availability": "true"},
+        )
+        expected = [s for s in suppliers if s.category == category and s.available]
+        self.assertEqual(resp.get_json()["total"], len(expected))
+        self.app.delete("{}/{}".format(BASE_URL, suppliers[0].id))
+        resp = self.app.get("{}/stats".format(BASE_URL))
+        self.assertEqual(resp.get_json()["total"], 4)
+
+    def test_stream_supplier_list(self):
+        """Stream a list of Suppliers as NDJSON"""
+        suppliers = self._create_suppliers(5)
+        resp = self.app.get(BASE_URL, headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.mimetype, "application/x-ndjson")
+        data = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(data), 5)
+        self.assertEqual(
+            [supplier["id"] for supplier in data],
+            sorted(supplier.id for supplier in suppliers),
+        )
+
+    def test_get_supplier_list_fast_serialization(self):
+        """Get a list of Suppliers from the fast path"""
+        suppliers = self._create_suppliers(5)
+        data = suppliers[0].serialize()
+        data["name"] = 'Caf\u00e9 "Dupont" \\ \U0001F600'
+        self.app.put("{}/{}".format(BASE_URL, suppliers[0].id), json=data)
+        for query_string in ("", "limit=3", "fields=name,status", "category=foods"):
+            resp = self.app.get(BASE_URL, query_string=query_string)
+            with patch.dict(app.config, FAST_LIST_SERIALIZATION=True):
+                fast_resp = self.app.get(BASE_URL, query_string=query_string)
+            self.assertEqual(fast_resp.status_code, status.HTTP_200_OK)
+            self.assertEqual(fast_resp.data, resp.data)
+            self.assertEqual(fast_resp.headers["ETag"], resp.headers["ETag"])
+            self.assertEqual(fast_resp.mimetype, "application/json")
+
     def test_get_supplier(self):
         """Get a single Supplier"""
         # get the id of a supplier
@@ -120,6 +317,70 @@ class TestSupplierServer(unittest.TestCase):
         data = resp.get_json()
         self.assertEqual(data["name"], test_supplier.name)
 
+    def test_get_supplier_not_modified(self):
+        """Get a Supplier with a matching If-None-Match"""
+        test_supplier = self._create_suppliers(1)[0]
+        resp = self.app.get("{}/{}".format(BASE_URL, test_supplier.id))
+        etag = resp.headers.get("ETag")
+        self.assertIsNotNone(etag)
+        resp = self.app.get(
+            "{}/{}".format(BASE_URL, test_supplier.id), headers={"If-None-Match": etag}
+        )
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(resp.data), 0)
+        self.assertEqual(resp.headers["ETag"], etag)
+
+    def test_get_supplier_list_not_modified(self):
+        """Get a list of Suppliers with a matching If-None-Match"""
+        suppliers = self._create_suppliers(3)
+        resp = self.app.get(BASE_URL)
+        etag = resp.headers.get("ETag")
+        resp = self.app.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        # a change to any supplier changes the ETag of the list
+        data = self.app.get("{}/{}".format(BASE_URL, suppliers[0].id)).get_json()
+        data["status"] = "disabled"
+        self.app.put("{}/{}".format(BASE_URL, suppliers[0].id), json=data)
+        resp = self.app.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+
+    def test_get_supplier_fields(self):
+        """Get only some of the fields of a Supplier"""
+        test_supplier = self._create_suppliers(1)[0]
+        url = "{}/{}".format(BASE_URL, test_supplier.id)
+        resp = self.app.get(url, query_string="fields=name")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), {"id": test_supplier.id, "name": test_supplier.name})
+        etag = resp.headers["ETag"]
+        self.assertNotEqual(etag, self.app.get(url).headers["ETag"])
+        resp = self.app.get(url, query_string="fields=name", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        resp = self.app.get(url, query_string="fields=name,version")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.get("{}/0".format(BASE_URL), query_string="fields=name")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_supplier_list_fields(self):
+        """Get only some of the fields of a list of Suppliers"""
+        suppliers = self._create_suppliers(3)
+        resp = self.app.get(BASE_URL, query_string="fields=name,available&limit=2")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(len(data), 2)
+        self.assertEqual(
+            data[0],
+            {"id": suppliers[0].id, "name": suppliers[0].name, "available": suppliers[0].available},
+        )
+        resp = self.app.get(
+            BASE_URL,
+            query_string="fields=category",
+            headers={"Accept": "application/x-ndjson"},
+        )
+        lines = resp.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(set(json.loads(lines[0])), {"id", "category"})
+
     def test_get_supplier_not_found(self):
         """Get a Supplier thats not found"""
         resp = self.app.get("/suppliers/0")
@@ -157,6 +418,174 @@ class TestSupplierServer(unittest.TestCase):
             new_supplier["available"], test_supplier.available, "Availability does not match"
         )
 
+    def test_sync_suppliers(self):
+        """Return only the Suppliers changed and deleted after a revision"""
+        with patch.dict(app.config, SYNC_SETTLE_SECONDS=0):
+            resp = self.app.get(BASE_URL, query_string="since=0")
+            self.assertEqual(resp.get_json(), {"revision": 0, "suppliers": [], "deleted": []})
+            suppliers = self._create_suppliers(3)
+            resp = self.app.get(BASE_URL, query_string="since=0")
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            data = resp.get_json()
+            self.assertEqual(len(data["suppliers"]), 3)
+            self.assertEqual(resp.headers["X-Revision"], str(data["revision"]))
+            revision = data["revision"]
+            self.app.put("{}/{}/disable".format(BASE_URL, suppliers[0].id))
+            self.app.delete("{}/{}".format(BASE_URL, suppliers[1].id))
+            with assert_max_queries(self, 3):
+                resp = self.app.get(BASE_URL, query_string="since={}".format(revision))
+            data = resp.get_json()
+            self.assertEqual([supplier["id"] for supplier in data["suppliers"]], [suppliers[0].id])
+            self.assertEqual(data["suppliers"][0]["status"], "disabled")
+            self.assertEqual(data["deleted"], [suppliers[1].id])
+            self.assertGreater(data["revision"], revision)
+            resp = self.app.get(BASE_URL, query_string="since={}".format(data["revision"]))
+            self.assertEqual(resp.get_json()["suppliers"], [])
+            self.assertEqual(resp.get_json()["revision"], data["revision"])
+            # one page of changes at a time
+            resp = self.app.get(BASE_URL, query_string="since=0&limit=2")
+            data = resp.get_json()
+            self.assertEqual(len(data["suppliers"]), 2)
+            resp = self.app.get(BASE_URL, query_string={"since": data["revision"], "limit": 2})
+            self.assertEqual(resp.get_json()["suppliers"], [])
+            self.assertEqual(resp.get_json()["deleted"], [suppliers[1].id])
+            resp = self.app.get(BASE_URL, query_string="since=0&category=x")
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+            resp = self.app.get(BASE_URL, query_string="since=0&fields=name")
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        # the changes have not settled yet
+        resp = self.app.get(BASE_URL, query_string="since={}".format(revision))
+        self.assertEqual(resp.get_json(), {"revision": revision, "suppliers": [], "deleted": []})
+        resp = self.app.get(BASE_URL, query_string="since=x")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_supplier_changes(self):
+        """Stream the changes to Suppliers as Server-Sent Events"""
+        config = {
+            "CHANGE_FEED_ENABLED": True,
+            "CHANGE_FEED_TIMEOUT": 0,
+            "CHANGE_FEED_POLL_SECONDS": 0.01,
+            "CHANGE_FEED_SETTLE_SECONDS": 0,
+        }
+        with patch.dict(app.config, config):
+            resp = self.app.get(BASE_URL + "/changes")
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertEqual(resp.mimetype, "text/event-stream")
+            self.assertEqual(resp.get_data(as_text=True), "retry: 10\n\n")
+            suppliers = self._create_suppliers(2)
+            self.app.put("{}/{}/disable".format(BASE_URL, suppliers[0].id))
+            self.app.delete("{}/{}".format(BASE_URL, suppliers[1].id))
+            resp = self.app.get(BASE_URL + "/changes", headers={"Last-Event-ID": "0"})
+        events = resp.get_data(as_text=True).split("\n\n")[1:-1]
+        self.assertEqual(len(events), 4)
+        lines = [event.split("\n") for event in events]
+        self.assertEqual(
+            [line[1] for line in lines],
+            ["event: create", "event: create", "event: disable", "event: delete"],
+        )
+        ids = [int(line[0][len("id: "):]) for line in lines]
+        self.assertEqual(ids, sorted(ids))
+        data = [json.loads(line[2][len("data: "):]) for line in lines]
+        self.assertEqual(data[0]["status"], "disabled")
+        self.assertEqual(data[0], data[2])
+        self.assertEqual(data[3], {"id": suppliers[1].id})
+        # workers that cannot hold a stream open tell the client not to reconnect
+        with patch.dict(app.config, CHANGE_FEED_ENABLED=False):
+            resp = self.app.get(BASE_URL + "/changes")
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_supplier_changes_stream_limit(self):
+        """Answer 503 when a worker already holds its limit of streams open"""
+        config = {
+            "CHANGE_FEED_ENABLED": True,
+            "CHANGE_FEED_MAX_STREAMS": 1,
+            "CHANGE_FEED_TIMEOUT": 0,
+            "CHANGE_FEED_POLL_SECONDS": 0.01,
+        }
+        with patch.dict(app.config, config):
+            first = self.app.get(BASE_URL + "/changes", buffered=False)
+            self.assertEqual(first.status_code, status.HTTP_200_OK)
+            resp = self.app.get(BASE_URL + "/changes")
+            self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertIn("Retry-After", resp.headers)
+            first.close()
+            # a stream that has ended is no longer counted
+            resp = self.app.get(BASE_URL + "/changes")
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            resp.get_data()
+            resp = self.app.get(BASE_URL + "/changes")
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            resp.get_data()
+
+    def test_supplier_changes_resume(self):
+        """Resume the change feed after the last event, or reset it"""
+        suppliers = self._create_suppliers(3)
+        config = {
+            "CHANGE_FEED_ENABLED": True,
+            "CHANGE_FEED_TIMEOUT": 0,
+            "CHANGE_FEED_POLL_SECONDS": 0.01,
+            "CHANGE_FEED_SETTLE_SECONDS": 0,
+        }
+        with patch.dict(app.config, config):
+            resp = self.app.get(BASE_URL + "/changes?last_event_id=0")
+            events = resp.get_data(as_text=True).split("\n\n")[1:-1]
+            first, second = [int(event.split("\n")[0][4:]) for event in events[:2]]
+            resp = self.app.get(BASE_URL + "/changes", headers={"Last-Event-ID": str(second)})
+            self.assertIn('"id": {}'.format(suppliers[2].id), resp.get_data(as_text=True))
+            self.assertEqual(resp.get_data(as_text=True).count("event: "), 1)
+            # the change after the last event was removed from the log
+            SupplierChange.query.filter(SupplierChange.id <= second).delete()
+            db.session.commit()
+            resp = self.app.get(BASE_URL + "/changes", headers={"Last-Event-ID": str(first)})
+            self.assertIn("event: reset", resp.get_data(as_text=True))
+            self.assertEqual(resp.get_data(as_text=True).count("event: "), 1)
+        resp = self.app.get(BASE_URL + "/changes", headers={"Last-Event-ID": "x"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_supplier_idempotent(self):
+        """Answer a retry with the same Idempotency-Key without creating a Supplier"""
+        data = SupplierFactory().serialize()
+        data["name"] = "Caf\u00e9 \u00dcml\u00e4ut \U0001F600"
+        headers = {"Idempotency-Key": "feed-42"}
+        resp = self.app.post(BASE_URL, json=data, headers=headers)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("Idempotent-Replayed", resp.headers)
+        reordered = dict(reversed(list(data.items())))
+        with assert_max_queries(self, 1):
+            retry = self.app.post(BASE_URL, json=reordered, headers=headers)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.get_data(), resp.get_data())
+        self.assertEqual(retry.content_type, resp.content_type)
+        self.assertEqual(retry.headers["Location"], resp.headers["Location"])
+        self.assertEqual(retry.headers["ETag"], resp.headers["ETag"])
+        self.assertEqual(len(self.app.get(BASE_URL).get_json()), 1)
+        # another key creates another Supplier
+        resp = self.app.post(BASE_URL, json=data, headers={"Idempotency-Key": "feed-43"})
+        self.assertNotEqual(resp.get_json()["id"], retry.get_json()["id"])
+
+    def test_create_supplier_idempotency_key_reused(self):
+        """Reject an Idempotency-Key that was used for another request"""
+        headers = {"Idempotency-Key": "feed-42"}
+        resp = self.app.post(BASE_URL, json=SupplierFactory().serialize(), headers=headers)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        resp = self.app.post(BASE_URL, json=SupplierFactory().serialize(), headers=headers)
+        self.assertEqual(resp.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        resp = self.app.post(
+            BASE_URL, json=SupplierFactory().serialize(), headers={"Idempotency-Key": "x" * 256}
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(self.app.get(BASE_URL).get_json()), 1)
+
+    def test_create_supplier_write_queue_full(self):
+        """Answer 503 when there are too many writes waiting to be committed"""
+        full = WriteQueueFull("Too many writes are waiting to be committed")
+        with patch.object(write_batcher, "enabled", True):
+            with patch.object(write_batcher, "submit", side_effect=full):
+                resp = self.app.post(BASE_URL, json=SupplierFactory().serialize())
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(resp.headers["Retry-After"], "1")
+
     def test_create_supplier_no_data(self):
         """Create a Supplier with missing data"""
         resp = self.app.post(BASE_URL, json={}, content_type=CONTENT_TYPE_JSON)
@@ -190,6 +619,48 @@ class TestSupplierServer(unittest.TestCase):
     #     )
     #     self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_suppliers_bulk(self):
+        """Create many Suppliers from a JSON array"""
+        test_suppliers = [supplier.serialize() for supplier in SupplierFactory.build_batch(3)]
+        test_suppliers.insert(1, {"name": "missing fields"})
+        test_suppliers.insert(2, dict(test_suppliers[0], name=None))
+        test_suppliers.insert(3, dict(test_suppliers[0], category="x" * 64))
+        resp = self.app.post(
+            BASE_URL + "/bulk", json=test_suppliers, content_type=CONTENT_TYPE_JSON
+        )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        data = resp.get_json()
+        self.assertEqual(len(data["ids"]), 3)
+        self.assertEqual([error["index"] for error in data["errors"]], [1, 2, 3])
+        resp = self.app.get("{}/{}".format(BASE_URL, data["ids"][2]))
+        self.assertEqual(resp.get_json()["name"], test_suppliers[5]["name"])
+
+    def test_create_suppliers_bulk_ndjson(self):
+        """Create many Suppliers from NDJSON"""
+        test_suppliers = SupplierFactory.build_batch(4)
+        body = "\n".join(json.dumps(supplier.serialize()) for supplier in test_suppliers)
+        resp = self.app.post(
+            BASE_URL + "/bulk", data=body, content_type="application/x-ndjson"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        data = resp.get_json()
+        self.assertEqual(len(data["ids"]), 4)
+        self.assertEqual(data["errors"], [])
+        resp = self.app.get(BASE_URL)
+        self.assertEqual(len(resp.get_json()), 4)
+
+    def test_create_suppliers_bulk_bad_data(self):
+        """Create many Suppliers with no valid data"""
+        resp = self.app.post(
+            BASE_URL + "/bulk", json=[{"name": "bad"}], content_type=CONTENT_TYPE_JSON
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(resp.get_json()["ids"], [])
+        resp = self.app.post(BASE_URL + "/bulk", json={}, content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.post(BASE_URL + "/bulk", data="[]", content_type="text/plain")
+        self.assertEqual(resp.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
     def test_update_supplier(self):
         """Update an existing Supplier"""
         # create a supplier to update
@@ -212,6 +683,96 @@ class TestSupplierServer(unittest.TestCase):
         updated_supplier = resp.get_json()
         self.assertEqual(updated_supplier["category"], "unknown")
 
+    def test_patch_supplier(self):
+        """Change some of the fields of a Supplier"""
+        supplier = self._create_suppliers(1)[0]
+        url = "{}/{}".format(BASE_URL, supplier.id)
+        etag = self.app.get(url).headers["ETag"]
+        with assert_max_queries(self, 1 if _supports_returning() else 2):
+            resp = self.app.patch(url, json={"available": not supplier.available})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data["available"], not supplier.available)
+        self.assertEqual(data["name"], supplier.name)
+        new_etag = resp.headers["ETag"]
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(self.app.get(url).get_json(), data)
+        # the If-Match header must have the current version
+        resp = self.app.patch(url, json={"status": "disabled"}, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.patch(url, json={"status": "disabled"}, headers={"If-Match": new_etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["status"], "disabled")
+
+    def test_patch_supplier_bad_request(self):
+        """Patch a Supplier that is missing or with bad data"""
+        supplier = self._create_suppliers(1)[0]
+        resp = self.app.patch("{}/0".format(BASE_URL), json={"status": "disabled"})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        url = "{}/{}".format(BASE_URL, supplier.id)
+        resp = self.app.patch(url, json={"available": "yes"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.patch(url, json={"id": 7})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.patch(url, data="status=disabled")
+        self.assertEqual(resp.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_update_supplier_if_match(self):
+        """Update a Supplier only if its ETag matches"""
+        test_supplier = self._create_suppliers(1)[0]
+        url = "{}/{}".format(BASE_URL, test_supplier.id)
+        resp = self.app.get(url)
+        etag = resp.headers["ETag"]
+        data = resp.get_json()
+        data["category"] = "unknown"
+        resp = self.app.put(url, json=data, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        # the old ETag no longer matches
+        data["category"] = "other"
+        resp = self.app.put(url, json=data, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.put(url + "/disable", json=data, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.app.get(url).get_json()["category"], "unknown")
+
+    def test_update_supplier_stale_cache(self):
+        """Update a Supplier that was changed behind the back of the cache"""
+        supplier = self._create_suppliers(1)[0]
+        url = "{}/{}".format(BASE_URL, supplier.id)
+        resp = self.app.get(url)
+        etag = resp.headers["ETag"]
+        data = resp.get_json()
+        # another worker changes the row, so the cached copy is out of date
+        db.session.execute(
+            Supplier.__table__.update()
+            .where(Supplier.id == supplier.id)
+            .values(status="disabled", version=Supplier.version + 1)
+        )
+        db.session.commit()
+        data["category"] = "unknown"
+        resp = self.app.put(url, json=data, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.put(url, json=data)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["category"], "unknown")
+        self.assertEqual(resp.get_json()["status"], data["status"])
+
+    def test_delete_supplier_if_match(self):
+        """Delete a Supplier only if its ETag matches"""
+        supplier = self._create_suppliers(1)[0]
+        url = "{}/{}".format(BASE_URL, supplier.id)
+        etag = self.app.get(url).headers["ETag"]
+        self.app.patch(url, json={"status": "disabled"})
+        resp = self.app.delete(url, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        etag = self.app.get(url).headers["ETag"]
+        resp = self.app.delete(url, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.app.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        resp = self.app.delete(url, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+
     def test_delete_supplier(self):
         """Delete a Supplier"""
         test_supplier = self._create_suppliers(1)[0]
@@ -226,6 +787,68 @@ class TestSupplierServer(unittest.TestCase):
         )
         self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_update_suppliers_bulk(self):
+        """Update many Suppliers by id and by filter"""
+        suppliers = self._create_suppliers(4)
+        resp = self.app.patch(
+            BASE_URL,
+            query_string=[("id", suppliers[0].id), ("id", suppliers[1].id)],
+            json={"status": "disabled"},
+            content_type=CONTENT_TYPE_JSON,
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["count"], 2)
+        statuses = {item["id"]: item["status"] for item in self.app.get(BASE_URL).get_json()}
+        self.assertEqual(statuses[suppliers[0].id], "disabled")
+        self.assertEqual(statuses[suppliers[2].id], "enabled")
+
+        category = suppliers[3].category
+        expected = len([supplier for supplier in suppliers if supplier.category == category])
+        resp = self.app.patch(
+            BASE_URL,
+            query_string="category={}".format(quote_plus(category)),
+            json={"available": False},
+            content_type=CONTENT_TYPE_JSON,
+        )
+        self.assertEqual(resp.get_json()["count"], expected)
+
+    def test_update_suppliers_bulk_bad_request(self):
+        """Update many Suppliers with bad data or no selection"""
+        supplier = self._create_suppliers(1)[0]
+        resp = self.app.patch(
+            BASE_URL, json={"status": "disabled"}, content_type=CONTENT_TYPE_JSON
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.patch(
+            BASE_URL,
+            query_string="id={}".format(supplier.id),
+            json={"available": "yes"},
+            content_type=CONTENT_TYPE_JSON,
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.patch(
+            BASE_URL,
+            query_string="id={}".format(supplier.id),
+            json={"color": "red"},
+            content_type=CONTENT_TYPE_JSON,
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_delete_suppliers_bulk(self):
+        """Delete many Suppliers by id"""
+        suppliers = self._create_suppliers(3)
+        resp = self.app.delete(
+            BASE_URL, query_string=[("id", suppliers[0].id), ("id", suppliers[2].id)]
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["count"], 2)
+        data = self.app.get(BASE_URL).get_json()
+        self.assertEqual([supplier["id"] for supplier in data], [suppliers[1].id])
+        resp = self.app.delete(BASE_URL)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.delete(BASE_URL, query_string="id=abc")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_query_supplier_list_by_category(self):
         """Query Suppliers by Category"""
         suppliers = self._create_suppliers(10)
@@ -241,6 +864,33 @@ class TestSupplierServer(unittest.TestCase):
         for supplier in data:
             self.assertEqual(supplier["category"], test_category)
 
+    def test_query_supplier_list_by_many_filters(self):
+        """Query Suppliers by Category, Availability and Status together"""
+        suppliers = self._create_suppliers(10)
+        test_category = suppliers[0].category
+        test_available = suppliers[0].available
+        expected = [
+            supplier
+            for supplier in suppliers
+            if supplier.category == test_category and supplier.available == test_available
+        ]
+        resp = self.app.get(
+            BASE_URL,
+            query_string="category={}&availability={}&status=enabled".format(
+                quote_plus(test_category), str(test_available).lower()
+            ),
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(len(data), len(expected))
+        for supplier in data:
+            self.assertEqual(supplier["category"], test_category)
+            self.assertEqual(supplier["available"], test_available)
+        resp = self.app.get(BASE_URL, query_string="status=disabled")
+        self.assertEqual(resp.get_json(), [])
+        resp = self.app.get(BASE_URL, query_string="availability=maybe")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
 #    # @patch('service.routes.Supplier.find_by_name')
 #     def test_bad_request(self, bad_request_mock):
 #         """ Test a Bad Request error from Find By Name """
@@ -276,6 +926,46 @@ class TestSupplierServer(unittest.TestCase):
             updated_supplier = resp.get_json()
             self.assertEqual(updated_supplier["status"], "disabled")
 
+    def test_disable_enable_supplier_without_body(self):
+        """Disable and enable a Supplier with one UPDATE and no body"""
+        supplier = self._create_suppliers(1)[0]
+        url = "{}/{}".format(BASE_URL, supplier.id)
+        with assert_max_queries(self, 1 if _supports_returning() else 2):
+            resp = self.app.put(url + "/disable")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["status"], "disabled")
+        self.assertEqual(resp.get_json()["name"], supplier.name)
+        etag = resp.headers["ETag"]
+        resp = self.app.put(url + "/enable", headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["status"], "enabled")
+        resp = self.app.put(url + "/disable", headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.put("{}/0/enable".format(BASE_URL))
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_disable_suppliers_bulk(self):
+        """Disable and enable the Suppliers matching a filter"""
+        suppliers = self._create_suppliers(6)
+        category = suppliers[0].category
+        expected = len([s for s in suppliers if s.category == category])
+        with assert_max_queries(self, 1):
+            resp = self.app.put(
+                "{}/disable".format(BASE_URL), query_string={"category": category}
+            )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), {"count": expected})
+        statuses = {s["id"]: s["status"] for s in self.app.get(BASE_URL).get_json()}
+        for supplier in suppliers:
+            disabled = supplier.category == category
+            self.assertEqual(statuses[supplier.id], "disabled" if disabled else "enabled")
+        resp = self.app.put(
+            "{}/enable".format(BASE_URL), query_string={"id": [suppliers[0].id]}
+        )
+        self.assertEqual(resp.get_json(), {"count": 1})
+        resp = self.app.put("{}/disable".format(BASE_URL))
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_method_not_allowed(self):
         """Make an illegal method call"""
         resp = self.app.put(BASE_URL)
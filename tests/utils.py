@@ -0,0 +1,49 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Test helpers that count the SQL statements sent to the database
+"""
+from contextlib import contextmanager
+from sqlalchemy import event
+from service.models import db
+
+
+@contextmanager
+def count_queries():
+    """Collects the SQL statements executed inside the with block"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "after_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "after_cursor_execute", record)
+
+
+@contextmanager
+def assert_max_queries(test_case, maximum: int):
+    """Fails the test if the with block executes more than maximum statements"""
+    with count_queries() as statements:
+        yield statements
+    test_case.assertLessEqual(
+        len(statements),
+        maximum,
+        "{} queries executed, expected at most {}:\n{}".format(
+            len(statements), maximum, "\n".join(statements)
+        ),
+    )